@@ -5,22 +5,21 @@ from dotenv import load_dotenv
 from config.db_config import init_db
 from piopiy.agent import Agent
 from piopiy.voice_agent import VoiceAgent
-from piopiy.audio.vad.silero import SileroVADAnalyzer
-from piopiy.services.openai.llm import OpenAILLMService
-from piopiy.services.google.stt import GoogleSTTService
-from piopiy.services.google.tts import GoogleTTSService
-from piopiy.transcriptions.language import Language
-from piopiy.pipeline.service_switcher import ServiceSwitcher, ServiceSwitcherStrategyManual
 from piopiy.adapters.schemas.function_schema import FunctionSchema
-from mcp_server.utils.sendWhatsappMessage import send_whatsapp_message
-from mcp_server.utils.location import search_village_fuzzy
+from mcp_server.utils.http_client import start_http_clients, close_http_clients
+from mcp_server.utils.alert_outbox import ALERT_REPLIES, EMERGENCY, ROUTINE, raise_alert, start_alert_dispatcher, stop_alert_dispatcher
+from mcp_server.utils.location import search_village_fuzzy, search_village_topk, init_village_index
+from mcp_server.utils import location_search_async
 from utils import user
+from utils.voice_services import voice_service_buffer
 load_dotenv()
 
 async def create_session(call_id: str, agent_id: str, from_number: str, to_number: str):
     
     calling_no = str(from_number)
     asyncio.create_task(user.create_user_if_not_exists(calling_no))
+    # The caller's police station once search_police_station finds it, for alerts
+    resolved = {"station": None}
     
     voice_agent = VoiceAgent(
         instructions=(
@@ -115,8 +114,9 @@ async def create_session(call_id: str, agent_id: str, from_number: str, to_numbe
         # LOCATION INTELLIGENCE
 
         Police Station Search:
-        If a user shares a area_name — find there nearest police station details by calling tool the `search_police_station_schema(areaname)` tool to get details of police station (make sure pass area name in english not devnagri)
+        If a user shares a area_name — find there nearest police station details by calling tool the `search_police_station_schema(areaname)` tool to get details of police station (pass area name exactly as the user said it, english or devnagri both work)
         use police station details extrat the police station name, address, officer, phone no, mobile no. (repeate the mobile no of officers twice in words first say meesage : i'm reapting number)
+        If the area name is unclear or may match several villages, call `search_police_station_candidates(areaname)` once; it returns the closest villages with scores and the margin between the top two. If the margin is small (below 0.1) ask the user which listed village they mean instead of searching again.
 
 
         # VERIFICATION SERVICES
@@ -220,84 +220,14 @@ async def create_session(call_id: str, agent_id: str, from_number: str, to_numbe
     
     
 
-    # Create STT and TTS services (same as before)
-    marathi_stt = GoogleSTTService(
-        credentials_path=os.getenv("GOOGLE_API_KEY"),
-        params=GoogleSTTService.InputParams(languages=[Language.MR_IN],
-                                                    enable_automatic_punctuation=False,
-        enable_spoken_punctuation=False,
-        enable_spoken_emojis=False,
-        enable_word_time_offsets=True,
-        enable_word_confidence=True,
-        enable_interim_results=True,
-        enable_voice_activity_events=True,
-        model="latest_long"),
-        sample_rate=16000
-    )
-    
-    hindi_stt = GoogleSTTService(
-        credentials_path=os.getenv("GOOGLE_API_KEY"),
-        params=GoogleSTTService.InputParams(languages=[Language.HI_IN],
-                                                    enable_automatic_punctuation=False,
-        enable_spoken_punctuation=False,
-        enable_spoken_emojis=False,
-        enable_word_time_offsets=True,
-        enable_word_confidence=True,
-        enable_interim_results=True,
-        enable_voice_activity_events=True,
-        model="latest_long"),
-        sample_rate=16000
-    )
-    
-    english_stt = GoogleSTTService(
-        credentials_path=os.getenv("GOOGLE_API_KEY"),
-        params=GoogleSTTService.InputParams(languages=[Language.EN_US], 
-                                                    enable_automatic_punctuation=False,
-        enable_spoken_punctuation=False,
-        enable_spoken_emojis=False,
-        enable_word_time_offsets=True,
-        enable_word_confidence=True,
-        enable_interim_results=True,
-        enable_voice_activity_events=True,
-        model="latest_long"),
-        sample_rate=16000
-    )
-
-    marathi_tts = GoogleTTSService(
-        credentials_path=os.getenv("GOOGLE_API_KEY"),
-        voice_id="en-US-Chirp3-HD-Algenib",
-        params=GoogleTTSService.InputParams(languages=[Language.MR_IN])
-    )
-    
-    hindi_tts = GoogleTTSService(
-        credentials_path=os.getenv("GOOGLE_API_KEY"),
-        voice_id="en-US-Chirp3-HD-Algenib",
-        params=GoogleTTSService.InputParams(languages=[Language.HI_IN])
-    )
-    
-    english_tts = GoogleTTSService(
-        credentials_path=os.getenv("GOOGLE_API_KEY"),
-        voice_id="en-US-Chirp3-HD-Algenib",
-        params=GoogleTTSService.InputParams(languages=[Language.EN_US])
-    )
-
-    stt_services = ServiceSwitcher(
-        services=[marathi_stt, hindi_stt, english_stt],
-        strategy_type=ServiceSwitcherStrategyManual
-    )
-    
-    tts_services = ServiceSwitcher(
-        services=[marathi_tts, hindi_tts, english_tts],
-        strategy_type=ServiceSwitcherStrategyManual
-    )
-
-    llm = OpenAILLMService(
-        api_key=os.getenv("OPENAI_API_KEY"),
-        stream=True,
-        system_language_awareness=True 
-    )
-
-    vad = SileroVADAnalyzer(sample_rate=16000)
+    # Built before the call came in; only the shared clients underneath outlive it
+    services = await voice_service_buffer.take()
+    marathi_stt, hindi_stt, english_stt = (services.stt[name] for name in ("marathi", "hindi", "english"))
+    marathi_tts, hindi_tts, english_tts = (services.tts[name] for name in ("marathi", "hindi", "english"))
+    stt_services = services.stt_services
+    tts_services = services.tts_services
+    llm = services.llm
+    vad = services.vad
     
     # 1. ADD LANGUAGE TOOL FIRST (with unique name)
     async def change_assistant_language_handler(params):
@@ -358,15 +288,18 @@ async def create_session(call_id: str, agent_id: str, from_number: str, to_numbe
                 }
             ]
         }
-        out = await send_whatsapp_message(
-            phone_number=os.getenv("OFFICER_NUMBER"),
+        # Queued, not sent here, so the caller is not kept waiting on the WhatsApp API;
+        # goes to the control room and, once known, the caller's station and its officer
+        _, outcome = await raise_alert(
             message=template_message,
-            is_template="template_with_components"
+            station=resolved["station"],
+            is_template="template_with_components",
+            priority=EMERGENCY if params.arguments.get("emergency") else ROUTINE,
+            call_id=call_id,
         )
-        
-        print(out)
-        await params.result_callback("alert sended to the officer they will contact you shortly.")
-        return f"alert sended to the officer they will contact you shortly."
+        reply = ALERT_REPLIES[outcome]
+        await params.result_callback(reply)
+        return reply
 
 
     
@@ -377,6 +310,10 @@ async def create_session(call_id: str, agent_id: str, from_number: str, to_numbe
             "message": {
                 "type": "string",
                 "description": "details of incident in short"
+            },
+            "emergency": {
+                "type": "boolean",
+                "description": "true when someone is in danger right now, false for a routine complaint"
             }
         },
         required=["message"]
@@ -389,6 +326,7 @@ async def create_session(call_id: str, agent_id: str, from_number: str, to_numbe
             print(station_area_name)
             village, station, score = await search_village_fuzzy(station_area_name)
             print(f"✓ Match: {village['villagename']} (Score: {score:.2f})")
+            resolved["station"] = station
             await params.result_callback(f"police station: {station}")
             return f"police station: {station}"
         except Exception as e:
@@ -409,9 +347,47 @@ async def create_session(call_id: str, agent_id: str, from_number: str, to_numbe
     )
     
     
+    async def search_police_station_candidates(params):
+        try:
+            print("location candidates called")
+            station_area_name = params.arguments.get("areaname", "").lower()
+            k = int(params.arguments.get("k", 3))
+            matches, margin = await search_village_topk(station_area_name, k)
+            if not matches:
+                raise Exception(f"no villages found for {station_area_name}")
+            candidates = "\n".join(
+                f"{rank}. village: {village['villagename']} (score: {score:.2f}) police station: {station}"
+                for rank, (village, station, score) in enumerate(matches, 1)
+            )
+            result = f"margin: {margin:.2f}\n{candidates}"
+            await params.result_callback(result)
+            return result
+        except Exception as e:
+            print(e)
+            await params.result_callback(f"station details not found please try again")
+            return f"station details not found please try again"
+    
+    search_police_station_candidates_schema = FunctionSchema(
+        name="search_police_station_candidates",  # Unique name
+        description="list the closest matching villages with their police stations when the area name is ambiguous",
+        properties={
+            "areaname": {
+                "type": "string",
+                "description": "name of area e.g ozar"
+            },
+            "k": {
+                "type": "integer",
+                "description": "number of villages to return, default 3"
+            }
+        },
+        required=["areaname"]
+    )
+    
+    
     voice_agent.add_tool(language_tool_schema, change_assistant_language_handler)
     voice_agent.add_tool(alert_officer_schema, send_alert_to_officer)
     voice_agent.add_tool(search_police_station_schema, search_police_station)
+    voice_agent.add_tool(search_police_station_candidates_schema, search_police_station_candidates)
     
 
     
@@ -424,17 +400,30 @@ async def create_session(call_id: str, agent_id: str, from_number: str, to_numbe
         vad=vad
     )
 
-    await voice_agent.start()
+    try:
+        await voice_agent.start()
+    finally:
+        voice_service_buffer.release(services)
 
 async def main():
     await init_db()
+    await init_village_index()
+    await start_http_clients()
+    # Station names and the station grid loaded before the first caller asks
+    print(f"Location search connections: {await location_search_async.warm_up()}")
+    await start_alert_dispatcher()
+    await voice_service_buffer.start()
     print("🚀 Starting agent with conflict-free language switching...")
     agent = Agent(
         agent_id=os.getenv("AGENT_ID"),
         agent_token=os.getenv("AGENT_TOKEN"),
         create_session=create_session,
     )
-    await agent.connect()
+    try:
+        await agent.connect()
+    finally:
+        await stop_alert_dispatcher()
+        await close_http_clients()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
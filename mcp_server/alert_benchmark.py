@@ -0,0 +1,174 @@
+import argparse
+import asyncio
+import io
+import os
+import time
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+
+from graph_mock import add_mock_arguments, mock_from_args
+
+# Outbox collections the tool mode writes to, dropped afterwards
+BENCH_OUTBOX = "bench_alert_outbox"
+BENCH_KEYS = "bench_alert_keys"
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def report(title, latencies, elapsed, ok, total):
+    print(f"\n{title}: {total} in {elapsed:.2f} s, {ok / elapsed:.1f}/s, {total - ok} failed")
+    print(f"  {'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    print(f"  {percentile(latencies, 50) * 1000:>9.1f}{percentile(latencies, 95) * 1000:>9.1f}"
+          f"{percentile(latencies, 99) * 1000:>9.1f}{max(latencies, default=0) * 1000:>9.1f}")
+
+
+def report_http(metrics):
+    for endpoint, stats in metrics.stats().items():
+        print(f"  {endpoint}: {stats['requests']} requests, {stats['retries']} retries, "
+              f"{stats['errors']} errors, statuses {stats['statuses']}")
+
+
+async def bench_send(args):
+    """send_whatsapp_message straight to the API, args.calls at a time"""
+    from utils.sendWhatsappMessage import send_whatsapp_message
+
+    semaphore = asyncio.Semaphore(args.calls)
+    latencies = []
+
+    async def send(i):
+        async with semaphore:
+            started = time.perf_counter()
+            delivered = await send_whatsapp_message(phone_number=f"91{9000000000 + i}",
+                                                    message=f"benchmark message {i}")
+            latencies.append(time.perf_counter() - started)
+            return delivered
+
+    started = time.perf_counter()
+    # send_whatsapp_message prints every response
+    with redirect_stdout(io.StringIO()):
+        results = await asyncio.gather(*(send(i) for i in range(args.messages)))
+    report("send_whatsapp_message", latencies, time.perf_counter() - started, sum(results), len(results))
+
+
+async def bench_tool(args):
+    """
+    The MCP send_alert_to_officer tool for args.calls simultaneous calls
+    at a time: how fast the caller is answered, then how long until every
+    queued alert is delivered by the dispatcher
+    """
+    import main
+    from utils import alert_outbox
+
+    station = {"_id": "bench", "mobNumber": "919000000001", "stationMobNumber": "919000000002"}
+
+    async def bench_station(station_id):
+        return station
+
+    # Every alert fans out to a station without touching piusers
+    main.get_station = bench_station
+    await alert_outbox.ensure_outbox_indexes()
+    await alert_outbox.ensure_key_indexes()
+    alert_outbox.dispatcher.start()
+
+    def session(session_id):
+        # The tool's Context, as far as it reads it: each call is its own MCP session
+        request = SimpleNamespace(headers={"mcp-session-id": session_id})
+        return SimpleNamespace(request_context=SimpleNamespace(request=request), session=None)
+
+    semaphore = asyncio.Semaphore(args.calls)
+    acks = []
+    run = int(time.time())
+
+    async def call(i):
+        async with semaphore:
+            started = time.perf_counter()
+            await main.send_alert_to_officer(f"benchmark alert {i}", session(f"bench-{run}-{i}"),
+                                             emergency=i % 10 == 0, station_id="bench")
+            acks.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(call(i) for i in range(args.messages)))
+        acked_after = time.perf_counter() - started
+        outbox = alert_outbox.outbox
+        while await outbox.count_documents({"status": {"$in": [alert_outbox.PENDING, alert_outbox.SENDING]}}):
+            if time.perf_counter() - started > args.timeout:
+                break
+            await asyncio.sleep(0.2)
+    elapsed = time.perf_counter() - started
+    await alert_outbox.dispatcher.stop()
+
+    report("send_alert_to_officer acknowledged", acks, acked_after, len(acks), args.messages)
+    alerts = await alert_outbox.outbox.find({}, {"status": 1, "created_at": 1, "sent_at": 1, "attempts": 1,
+                                                 "priority": 1}).to_list(length=None)
+    sent = [alert for alert in alerts if alert["status"] == alert_outbox.SENT]
+    for lane, priority in (("emergency", alert_outbox.EMERGENCY), ("routine", alert_outbox.ROUTINE)):
+        delays = [(alert["sent_at"] - alert["created_at"]).total_seconds()
+                  for alert in sent if alert["priority"] == priority]
+        report(f"{lane} alerts delivered", delays, elapsed,
+               len(delays), sum(1 for alert in alerts if alert["priority"] == priority))
+    retried = sum(1 for alert in alerts if alert.get("attempts", 0) > 1)
+    print(f"  {retried} alerts needed more than one attempt; dispatcher {alert_outbox.dispatcher.stats()}")
+    print(f"  dedupe {alert_outbox.dedupe_stats()}")
+
+    if not args.keep:
+        await alert_outbox.outbox.drop()
+        await alert_outbox.alert_keys.drop()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the WhatsApp alert path against a local Graph API mock")
+    parser.add_argument("--mode", choices=["send", "tool", "both"], default="send",
+                        help="tool also needs MONGO_URI, for the outbox")
+    parser.add_argument("--calls", type=int, default=50, help="concurrent callers")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--base-url", help="an already running mock or API; by default one is started here")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--send-rate", type=float, help="override WHATSAPP_MESSAGES_PER_SEC")
+    parser.add_argument("--workers", type=int, help="override ALERT_WORKERS")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for the outbox to drain")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark outbox collections")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    # Read by the utils modules at import
+    os.environ["ALERT_OUTBOX_COLLECTION"] = BENCH_OUTBOX
+    os.environ["ALERT_KEYS_COLLECTION"] = BENCH_KEYS
+    os.environ.setdefault("WHATSAPP_PHONE_ID", "bench")
+    os.environ.setdefault("OFFICER_NUMBER", "919000000000")
+    if args.send_rate:
+        os.environ["WHATSAPP_MESSAGES_PER_SEC"] = str(args.send_rate)
+    if args.workers:
+        os.environ["ALERT_WORKERS"] = str(args.workers)
+
+    from utils import sendWhatsappMessage
+    from utils.http_client import close_http_clients, metrics, start_http_clients
+
+    mock, runner = None, None
+    if args.base_url:
+        sendWhatsappMessage.FACEBOOK_BASE_URL = args.base_url
+    else:
+        mock = mock_from_args(args)
+        runner = await mock.start(port=args.port)
+        sendWhatsappMessage.FACEBOOK_BASE_URL = f"http://127.0.0.1:{args.port}/v18.0"
+
+    await start_http_clients()
+    try:
+        for mode in (["send", "tool"] if args.mode == "both" else [args.mode]):
+            await (bench_send if mode == "send" else bench_tool)(args)
+            report_http(metrics)
+            if mock is not None:
+                print(f"  mock {mock.stats()}")
+                mock.reset()
+    finally:
+        await close_http_clients()
+        if runner is not None:
+            await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,293 @@
+import argparse
+import asyncio
+import copy
+import io
+import random
+import re
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+import utils.location as location
+from utils.cache import TTLCache
+from utils.normalize import normalize_name
+from utils.village_index import VillageIndex
+from utils.village_scoring import ScoringPool
+
+# Syllables and suffixes that make plausible romanized Marathi village names
+ONSETS = ["k", "kh", "g", "ch", "j", "t", "d", "n", "p", "ph", "b", "bh", "m",
+          "y", "r", "l", "v", "s", "sh", "h", "dh", "th", ""]
+VOWELS = ["a", "a", "a", "i", "u", "e", "o", "aa", "ai"]
+CODAS = ["", "", "", "n", "r", "l", "m", "s", "d"]
+SUFFIXES = ["", "", "", "wadi", "gaon", "nagar", "pada", "pur", "khed", "ner"]
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    async def to_list(self, length=None):
+        return self._docs if length is None else self._docs[:length]
+
+
+class FakeCollection:
+    """
+    In-memory stand-in for the few Motor collection calls the village search
+    makes: equality, $in, $gt, $exists, $regex and $or queries, and the
+    village -> station aggregation. Anything else raises rather than
+    matching silently. Queries with an equality or missing-field condition
+    narrow through a hash index on that field first, as Mongo would through
+    a real index, so the stand-in does not dominate the timings.
+    """
+
+    def __init__(self, database, docs=()):
+        self.database = database
+        self._docs = list(docs)
+        self._indexes = {}
+
+    def _matches(self, doc, query):
+        for field, condition in query.items():
+            if field == "$or":
+                if not any(self._matches(doc, clause) for clause in condition):
+                    return False
+                continue
+            if field.startswith("$"):
+                raise NotImplementedError(f"{field} is not supported by the benchmark stand-in")
+            value = doc.get(field)
+            if not isinstance(condition, dict):
+                if value != condition:
+                    return False
+                continue
+            for operator, operand in condition.items():
+                if operator == "$in":
+                    matched = value in operand
+                elif operator == "$gt":
+                    matched = value is not None and value > operand
+                elif operator == "$exists":
+                    matched = (field in doc) == operand
+                elif operator == "$regex":
+                    flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0
+                    matched = isinstance(value, str) and re.search(operand, value, flags) is not None
+                elif operator == "$options":
+                    matched = True
+                else:
+                    raise NotImplementedError(f"{operator} is not supported by the benchmark stand-in")
+                if not matched:
+                    return False
+        return True
+
+    def _index(self, field):
+        if field not in self._indexes:
+            index = {}
+            for doc in self._docs:
+                index.setdefault(doc.get(field), []).append(doc)
+            self._indexes[field] = index
+        return self._indexes[field]
+
+    def _select(self, query):
+        if list(query) == ["$or"]:
+            seen = set()
+            docs = []
+            for clause in query["$or"]:
+                for doc in self._select(clause):
+                    if id(doc) not in seen:
+                        seen.add(id(doc))
+                        docs.append(doc)
+            return docs
+        candidates = self._docs
+        for field, condition in query.items():
+            if field.startswith("$"):
+                continue
+            if not isinstance(condition, dict):
+                candidates = self._index(field).get(condition, [])
+                break
+            if condition == {"$exists": False}:
+                # Missing and null fields share the None key; _matches tells them apart
+                candidates = self._index(field).get(None, [])
+                break
+        return [doc for doc in candidates if self._matches(doc, query)]
+
+    def _object_id(self, doc, sources):
+        value = next((doc[source] for source in sources if doc.get(source) is not None), None)
+        return ObjectId(value) if ObjectId.is_valid(value) else None
+
+    def find(self, query=None, projection=None):
+        return FakeCursor([copy.copy(doc) for doc in self._select(query or {})])
+
+    async def find_one(self, query=None, projection=None):
+        docs = self._select(query or {})
+        return copy.copy(docs[0]) if docs else None
+
+    def aggregate(self, pipeline):
+        docs = self._docs
+        for stage in pipeline:
+            if "$match" in stage:
+                docs = self._select(stage["$match"])
+            elif "$limit" in stage:
+                docs = docs[:stage["$limit"]]
+            elif "$addFields" in stage:
+                for field, expression in stage["$addFields"].items():
+                    source = expression["$convert"]["input"]
+                    # A field path, or $ifNull over field paths
+                    sources = [path.lstrip("$") for path in source.get("$ifNull", [])] if isinstance(source, dict) else [source.lstrip("$")]
+                    docs = [
+                        {**doc, field: self._object_id(doc, sources)}
+                        for doc in docs
+                    ]
+            elif "$lookup" in stage:
+                lookup = stage["$lookup"]
+                foreign = self.database[lookup["from"]]
+                docs = [
+                    {**doc, lookup["as"]: foreign._select({lookup["foreignField"]: doc.get(lookup["localField"])})}
+                    for doc in docs
+                ]
+        return FakeCursor([copy.copy(doc) for doc in docs])
+
+    def watch(self, *args, **kwargs):
+        raise OperationFailure("change streams are not supported by the benchmark stand-in")
+
+
+class FakeDatabase(dict):
+    def __missing__(self, name):
+        self[name] = FakeCollection(self)
+        return self[name]
+
+    async def command(self, name):
+        # A standalone server's reply: no operationTime, so watches start from now
+        return {"ok": 1.0}
+
+
+def make_gazetteer(size, stations, rng):
+    """Unique synthetic village names, each assigned to a random station"""
+    names = set()
+    while len(names) < size:
+        syllables = [rng.choice(ONSETS) + rng.choice(VOWELS) + rng.choice(CODAS)
+                     for _ in range(rng.randint(1, 3))]
+        names.add(("".join(syllables) + rng.choice(SUFFIXES)).capitalize())
+    return [
+        {
+            "_id": ObjectId(),
+            "villagename": name,
+            "villagename_norm": normalize_name(name),
+            "stationId": str(rng.choice(stations)["_id"]),
+        }
+        for name in sorted(names)
+    ]
+
+
+def misspell(name, rng, edits=1):
+    """Apply voice-transcription style mistakes to a name"""
+    text = name
+    for _ in range(edits):
+        op = rng.choice(("drop", "vw", "double", "space", "case"))
+        if op == "drop" and len(text) > 3:
+            i = rng.randrange(1, len(text))
+            text = text[:i] + text[i + 1:]
+        elif op == "vw" and any(c in text.lower() for c in "vw"):
+            text = text.translate(str.maketrans("vwVW", "wvWV"))
+        elif op == "double":
+            vowels = [i for i, c in enumerate(text) if c.lower() in "aeiou"]
+            if vowels:
+                i = rng.choice(vowels)
+                text = text[:i] + text[i] + text[i:]
+        elif op == "space" and len(text) > 4:
+            if " " in text:
+                text = text.replace(" ", "", 1)
+            else:
+                i = rng.randrange(2, len(text) - 1)
+                text = text[:i] + " " + text[i:]
+        else:
+            text = text.lower() if rng.random() < 0.5 else text.upper()
+    return text
+
+
+async def full_scan(name):
+    """The original algorithm: score every village, for comparison"""
+    best_match, best_score = None, 0
+    for village in location.village_index.entries:
+        score = location.similar(name, village["villagename"])
+        if score > best_score:
+            best_match, best_score = village, score
+    return best_match if best_score >= 0.7 else None
+
+
+async def fuzzy(name):
+    village, _, _ = await location.search_village_fuzzy(name)
+    return village
+
+
+async def topk(name):
+    matches, _ = await location.search_village_topk(name, 5)
+    return matches[0][0] if matches else None
+
+
+BACKENDS = {"search_village_fuzzy": fuzzy, "search_village_topk": topk, "full_scan": full_scan}
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def run(size, backends, queries, edits, seed, scorer):
+    rng = random.Random(seed)
+    db = FakeDatabase()
+    db["piusers"]._docs = [{"_id": ObjectId(), "stationName": f"Station {i}"} for i in range(40)]
+    db["villages"]._docs = make_gazetteer(size, db["piusers"]._docs, rng)
+    location.db = db
+    location.station_cache = TTLCache()
+    location.village_index = VillageIndex()
+    location.scoring_pool = ScoringPool(location.village_index, mode=scorer)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    await location.village_index.ensure_loaded(db["villages"])
+    build_secs = time.perf_counter() - started
+    index_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    cases = []
+    for village in rng.sample(db["villages"]._docs, min(queries, size)):
+        cases.append((misspell(village["villagename"], rng, edits), village["_id"]))
+
+    print(f"\n{size} villages: index built in {build_secs * 1000:.0f} ms, "
+          f"{index_bytes / 1e6:.1f} MB")
+    print(f"  {'backend':<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'q/s':>9}{'top-1':>8}")
+    for backend in backends:
+        search = BACKENDS[backend]
+        latencies = []
+        correct = 0
+        # The search functions print every match; keep that out of the report
+        with redirect_stdout(io.StringIO()):
+            for query, expected in cases:
+                started = time.perf_counter()
+                village = await search(query)
+                latencies.append(time.perf_counter() - started)
+                correct += bool(village) and village["_id"] == expected
+        total = sum(latencies)
+        print(f"  {backend:<22}{percentile(latencies, 50) * 1000:>9.2f}"
+              f"{percentile(latencies, 95) * 1000:>9.2f}{percentile(latencies, 99) * 1000:>9.2f}"
+              f"{len(cases) / total:>9.0f}{correct / len(cases):>8.1%}")
+    location.scoring_pool.shutdown()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark village search backends on synthetic gazetteers")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS),
+                        default=["search_village_fuzzy", "search_village_topk"])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--edits", type=int, default=1, help="misspellings applied per query")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--scorer", choices=["inline", "thread", "process"], default="inline",
+                        help="where fuzzy scoring runs")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        await run(size, args.backends, args.queries, args.edits, args.seed, args.scorer)
+
+if __name__ == "__main__":
+    asyncio.run(main())
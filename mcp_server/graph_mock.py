@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import deque
+
+from aiohttp import web
+
+
+class GraphMock:
+    """
+    Stand-in for the WhatsApp Cloud API messages endpoint. Point
+    FACEBOOK_BASE_URL at http://host:port/v18.0 and sends are answered
+    after latency_ms (plus up to jitter_ms), failing with a 500 at
+    error_rate and with a 429 at throttle_rate or beyond rate_limit
+    messages per second, in the shape the real API answers.
+    """
+
+    def __init__(self, latency_ms=150, jitter_ms=50, error_rate=0.0, throttle_rate=0.0, rate_limit=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self._recent = deque()
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.accepted = 0
+        self.errors = 0
+        self.throttled = 0
+        self.recipients = {}
+        self._recent.clear()
+
+    def _over_limit(self):
+        if not self.rate_limit:
+            return False
+        current = time.monotonic()
+        while self._recent and self._recent[0] <= current - 1:
+            self._recent.popleft()
+        if len(self._recent) >= self.rate_limit:
+            return True
+        self._recent.append(current)
+        return False
+
+    async def messages(self, request):
+        self.requests += 1
+        payload = await request.json()
+        await asyncio.sleep((self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000)
+
+        if self._over_limit() or random.random() < self.throttle_rate:
+            self.throttled += 1
+            return web.json_response(
+                {"error": {"message": "(#130429) Rate limit hit", "type": "OAuthException", "code": 130429}},
+                status=429, headers={"Retry-After": "1"},
+            )
+        if random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response(
+                {"error": {"message": "An unknown error has occurred.", "type": "OAuthException", "code": 1}},
+                status=500,
+            )
+
+        self.accepted += 1
+        to = payload.get("to")
+        self.recipients[to] = self.recipients.get(to, 0) + 1
+        return web.json_response({
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": to, "wa_id": to}],
+            "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}],
+        })
+
+    async def stats_handler(self, request):
+        return web.json_response(self.stats())
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "accepted": self.accepted,
+            "errors": self.errors,
+            "throttled": self.throttled,
+            "recipients": len(self.recipients),
+        }
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/{version}/{phone_id}/messages", self.messages)
+        app.router.add_get("/stats", self.stats_handler)
+        return app
+
+    async def start(self, host="127.0.0.1", port=8808):
+        """Serve in the running loop; returns the runner to clean up"""
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+def add_mock_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of sends answered with a 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of sends answered with a 429")
+    parser.add_argument("--rate-limit", type=int, default=0,
+                        help="messages per second accepted before answering 429 (0: unlimited)")
+
+
+def mock_from_args(args):
+    return GraphMock(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate, args.rate_limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the WhatsApp Graph API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8808)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    print(f"FACEBOOK_BASE_URL=http://{args.host}:{args.port}/v18.0")
+    web.run_app(mock_from_args(args).app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
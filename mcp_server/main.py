@@ -1,11 +1,27 @@
 from dotenv import load_dotenv
 load_dotenv()
-from mcp.server.fastmcp import FastMCP
-from utils.location import search_village_fuzzy
-from utils.sendWhatsappMessage import send_whatsapp_message
-import os
+from contextlib import asynccontextmanager
+from mcp.server.fastmcp import Context, FastMCP
+from utils.location import get_station, search_village_fuzzy, search_village_topk, init_village_index
+from utils.alert_outbox import ALERT_REPLIES, EMERGENCY, ROUTINE, raise_alert, start_alert_dispatcher, stop_alert_dispatcher
+from utils.http_client import start_http_clients, close_http_clients
+
+@asynccontextmanager
+async def lifespan(server):
+    # Idempotent, so the index is loaded once however many sessions connect
+    await init_village_index()
+    # One pooled HTTP session for Maps and WhatsApp calls, closed on shutdown
+    await start_http_clients()
+    # Sends the alerts the tools queue
+    await start_alert_dispatcher()
+    try:
+        yield
+    finally:
+        await stop_alert_dispatcher()
+        await close_http_clients()
+
 # Stateful server (maintains session state)
-mcp = FastMCP("StatefulServer")
+mcp = FastMCP("StatefulServer", lifespan=lifespan)
 
 # Add a simple tool to demonstrate the server
 @mcp.tool()
@@ -17,7 +33,27 @@ async def get_police_station(area_name) -> str:
     return f"police {station}"
 
 @mcp.tool()
-async def send_alert_to_officer(message) -> str:
+async def get_police_station_candidates(area_name, k: int = 3) -> str:
+    print(area_name)
+    matches, margin = await search_village_topk(area_name, k)
+    candidates = "\n".join(
+        f"{rank}. village: {village['villagename']} (score: {score:.2f}) police {station}"
+        for rank, (village, station, score) in enumerate(matches, 1)
+    )
+    return f"margin: {margin:.2f}\n{candidates}"
+
+def session_scope(ctx: Context) -> str:
+    """
+    The MCP session a tool call arrived on, so repeats of an alert within
+    one conversation are sent once. Streamable HTTP names the session in a
+    header; a transport without one is scoped to its session object.
+    """
+    request = getattr(ctx.request_context, "request", None)
+    session_id = request.headers.get("mcp-session-id") if request is not None else None
+    return session_id or f"session-{id(ctx.session)}"
+
+@mcp.tool()
+async def send_alert_to_officer(message, ctx: Context, emergency: bool = False, station_id: str = "") -> str:
     print(message)
     template_message = {
         "name": "alert_message_to_officer",
@@ -36,15 +72,16 @@ async def send_alert_to_officer(message) -> str:
             }
         ]
     }
-    out = await send_whatsapp_message(
-        phone_number=os.getenv("OFFICER_NUMBER"),
+    # Queued, not sent here, so the caller is not kept waiting on the WhatsApp API;
+    # goes to the control room and, given the _id from get_police_station, that station
+    _, outcome = await raise_alert(
         message=template_message,
-        is_template="template_with_components"
+        station=await get_station(station_id) if station_id else None,
+        is_template="template_with_components",
+        priority=EMERGENCY if emergency else ROUTINE,
+        call_id=session_scope(ctx),
     )
-    
-    print(out)
-    
-    return f"alert sended to the officer they will contact you shortly."
+    return ALERT_REPLIES[outcome]
 
 
 
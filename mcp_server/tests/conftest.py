@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The server and its scripts import the utils package from mcp_server/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
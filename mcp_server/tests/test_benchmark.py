@@ -0,0 +1,73 @@
+import asyncio
+import random
+import sys
+
+import pytest
+
+import benchmark
+from benchmark import FakeDatabase, make_gazetteer, misspell
+from utils.normalize import exact_name_query
+from utils.village_index import VillageIndex, make_entry
+from utils.village_scoring import best_village, match_village
+
+
+def test_benchmark_runs(monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["benchmark.py", "--sizes", "1000", "--queries", "100"])
+    asyncio.run(benchmark.main())
+    report = capsys.readouterr().out
+    assert "1000 villages" in report
+    assert "search_village_fuzzy" in report and "search_village_topk" in report
+
+
+@pytest.fixture(scope="module")
+def gazetteer():
+    rng = random.Random(11)
+    villages = make_gazetteer(5000, [{"_id": "station"}], rng)
+    index = VillageIndex()
+    index.load_entries(make_entry(village) for village in villages)
+    return villages, index
+
+
+def assert_scores_as_a_full_scan(index, query, threshold):
+    """At or above the threshold the score is the full scan's best; below it, no match"""
+    _, score = match_village(index, query, threshold)
+    _, full_score = best_village(query, index.entries)
+    if full_score >= threshold:
+        assert score == full_score, query
+    else:
+        assert score < threshold, query
+
+
+def test_match_village_scores_misspellings_as_a_full_scan(gazetteer):
+    villages, index = gazetteer
+    rng = random.Random(5)
+    for village in rng.sample(villages, 100):
+        assert_scores_as_a_full_scan(index, misspell(village["villagename"], rng, edits=2).lower(), 0.7)
+
+
+def test_match_village_scores_loose_queries_as_a_full_scan(gazetteer):
+    # Loose matches are where the trigram shortlist alone misses the best village
+    _, index = gazetteer
+    rng = random.Random(5)
+    for _ in range(150):
+        query = "".join(rng.choice("aeioukgtnrsvh") for _ in range(rng.randint(4, 10)))
+        assert_scores_as_a_full_scan(index, query, 0.6)
+
+
+def test_stand_in_serves_exact_name_queries():
+    villages = FakeDatabase()["villages"]
+    villages._docs = [
+        {"_id": 1, "villagename": "Shiv Nagar", "villagename_norm": "shiv nagar"},
+        {"_id": 2, "villagename": "Ram  Wadi"},
+        {"_id": 3, "villagename": "Ramwadi Khurd"},
+    ]
+    assert [doc["_id"] for doc in villages._select(exact_name_query("villages", "SHIV nagar"))] == [1]
+    assert [doc["_id"] for doc in villages._select(exact_name_query("villages", "ram wadi"))] == [2]
+    assert villages._select(exact_name_query("villages", "ramwadi")) == []
+
+
+def test_stand_in_rejects_unsupported_operators():
+    villages = FakeDatabase()["villages"]
+    villages._docs = [{"_id": 1, "villagename": "Shiv Nagar"}]
+    with pytest.raises(NotImplementedError):
+        villages._select({"villagename": {"$ne": "Shiv Nagar"}})
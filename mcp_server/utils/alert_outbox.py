@@ -0,0 +1,441 @@
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from .cache import MISSING, TTLCache
+from .location import db
+from .normalize import normalize_name
+from .rate_limit import TokenBucket
+from .sendWhatsappMessage import send_whatsapp_message
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_COLLECTION = os.getenv("ALERT_OUTBOX_COLLECTION", "alert_outbox")
+# Dispatcher tasks per process, plus one that only ever takes emergencies
+WORKERS = int(os.getenv("ALERT_WORKERS", 4))
+MAX_ATTEMPTS = int(os.getenv("ALERT_MAX_ATTEMPTS", 8))
+BACKOFF_BASE = float(os.getenv("ALERT_BACKOFF_BASE", 5))
+BACKOFF_MAX = float(os.getenv("ALERT_BACKOFF_MAX", 300))
+# An alert claimed longer ago than this by a dispatcher that died is taken again
+LEASE_SECS = int(os.getenv("ALERT_LEASE_SECS", 120))
+# Idle workers look for due retries and alerts queued by other processes this often
+POLL_INTERVAL = float(os.getenv("ALERT_POLL_SECS", 2))
+
+# Messages per second this process sends to the WhatsApp Cloud API. Keep it
+# at or under the business number's throughput tier (80 by default, up to
+# 1000 once Meta upgrades the number) divided by the number of processes
+SEND_RATE = float(os.getenv("WHATSAPP_MESSAGES_PER_SEC", 80))
+SEND_BURST = float(os.getenv("WHATSAPP_MESSAGES_BURST", SEND_RATE))
+# Who a fanned-out alert goes to, and the piusers field holding the number
+CONTROL_ROOM = "control_room"
+STATION_RECIPIENTS = (("station_officer", "mobNumber"), ("station", "stationMobNumber"))
+
+# The same alert from the same call within this long is sent only once
+KEYS_COLLECTION = os.getenv("ALERT_KEYS_COLLECTION", "alert_keys")
+DEDUPE_WINDOW = int(os.getenv("ALERT_DEDUPE_WINDOW_SECS", 15 * 60))
+# A tool waits this long for MongoDB to take an alert before sending it itself
+ENQUEUE_TIMEOUT = float(os.getenv("ALERT_ENQUEUE_TIMEOUT_SECS", 3))
+
+# Lower sorts first
+EMERGENCY = 0
+ROUTINE = 1
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+# What raise_alert did with an alert
+QUEUED = "queued"
+DUPLICATE = "duplicate"
+
+outbox = db[OUTBOX_COLLECTION]
+send_limiter = TokenBucket(SEND_RATE, SEND_BURST)
+alert_keys = db[KEYS_COLLECTION]
+# Alert key -> group id, so repeats in this process never reach MongoDB
+recent_alerts = TTLCache(maxsize=4096, ttl=DEDUPE_WINDOW)
+# Duplicates collapsed in memory and by the unique index
+suppressed = {"local": 0, "db": 0}
+
+
+def now():
+    return datetime.now(timezone.utc)
+
+
+def retry_delay(attempts: int) -> float:
+    """Full-jitter backoff in seconds after the given number of failed attempts"""
+    return random.uniform(BACKOFF_BASE / 2, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1)))
+
+
+async def ensure_outbox_indexes(collection=outbox):
+    """Claim order, and the per-recipient results of a fan-out"""
+    await collection.create_index([("status", ASCENDING), ("priority", ASCENDING), ("next_attempt_at", ASCENDING)])
+    await collection.create_index("group_id", sparse=True)
+
+
+async def ensure_key_indexes(keys=alert_keys):
+    """One document per alert key; MongoDB drops them once the window is over"""
+    await keys.create_index("key", unique=True)
+    await keys.create_index("created_at", expireAfterSeconds=DEDUPE_WINDOW)
+
+
+def alert_text(message: Any) -> str:
+    """The words of an alert: the text itself, or every text parameter of a template"""
+    if isinstance(message, str):
+        return message
+    if isinstance(message, dict):
+        return " ".join(value if key == "text" and isinstance(value, str) else alert_text(value)
+                        for key, value in message.items() if key == "text" or isinstance(value, (dict, list)))
+    if isinstance(message, list):
+        return " ".join(alert_text(item) for item in message)
+    return ""
+
+
+def alert_key(call_id: str, message: Any) -> str:
+    """Same call and same words, ignoring case, spacing, punctuation and script"""
+    words = normalize_name(re.sub(r"[^\w\s]", " ", alert_text(message)))
+    return hashlib.sha1(f"{call_id}\n{words}".encode()).hexdigest()
+
+
+async def claim_alert_key(key: str, group_id: str, keys=alert_keys) -> str:
+    """
+    Record group_id as the alert for key and return it, or return the group
+    id already recorded for key within the window
+    """
+    existing = recent_alerts.get(key)
+    if existing is not MISSING:
+        suppressed["local"] += 1
+        return existing
+
+    # Only a claim MongoDB has accepted is remembered locally, so a failed
+    # write never makes the retry look like a duplicate
+    created = now()
+    try:
+        await keys.insert_one({"key": key, "group_id": group_id, "created_at": created})
+        recent_alerts.set(key, group_id)
+        return group_id
+    except DuplicateKeyError:
+        pass
+    # The TTL monitor runs about once a minute, so an expired key may linger
+    taken = await keys.update_one(
+        {"key": key, "created_at": {"$lt": created - timedelta(seconds=DEDUPE_WINDOW)}},
+        {"$set": {"group_id": group_id, "created_at": created}},
+    )
+    if taken.modified_count:
+        recent_alerts.set(key, group_id)
+        return group_id
+    doc = await keys.find_one({"key": key})
+    existing = doc["group_id"] if doc else group_id
+    recent_alerts.set(key, existing)
+    if existing != group_id:
+        suppressed["db"] += 1
+    return existing
+
+
+async def release_alert_key(key: str, group_id: str, keys=alert_keys):
+    """Undo claim_alert_key for an alert that was never queued, so it can be retried"""
+    recent_alerts.invalidate(key)
+    await keys.delete_one({"key": key, "group_id": group_id})
+
+
+def dedupe_stats():
+    return {"suppressed": suppressed["local"] + suppressed["db"],
+            "suppressed_local": suppressed["local"], "suppressed_db": suppressed["db"],
+            "recent_keys": len(recent_alerts)}
+
+
+async def enqueue_alert(phone_number: str, message: Any, is_template: str = "custom",
+                        priority: int = ROUTINE, collection=outbox, **details) -> str:
+    """
+    Store an alert for the dispatcher and return its id straight away.
+    Anything in details (call_id, kind, ...) is kept on the document.
+    """
+    created = now()
+    doc = {
+        **details,
+        "phone_number": phone_number,
+        "message": message,
+        "is_template": is_template,
+        "priority": priority,
+        "status": PENDING,
+        "attempts": 0,
+        "next_attempt_at": created,
+        "created_at": created,
+        "updated_at": created,
+    }
+    result = await collection.insert_one(doc)
+    dispatcher.wake()
+    return str(result.inserted_id)
+
+
+async def alert_status(alert_id: str, collection=outbox) -> Optional[Dict[str, Any]]:
+    """Delivery status of one alert, or None if there is no such alert"""
+    try:
+        _id = ObjectId(alert_id)
+    except (InvalidId, TypeError):
+        return None
+    return await collection.find_one({"_id": _id}, {
+        "status": 1, "priority": 1, "attempts": 1, "last_error": 1,
+        "created_at": 1, "sent_at": 1, "next_attempt_at": 1,
+    })
+
+
+def alert_recipients(station: Optional[Dict[str, Any]] = None,
+                     control_room: Optional[str] = None) -> List[Tuple[str, str]]:
+    """
+    (role, phone number) for the control room and, when the caller's station
+    is known, its officer and its station number; a number is listed once
+    """
+    control_room = control_room if control_room is not None else os.getenv("OFFICER_NUMBER")
+    candidates = [(CONTROL_ROOM, control_room)]
+    for role, field in STATION_RECIPIENTS:
+        candidates.append((role, (station or {}).get(field)))
+
+    recipients = []
+    seen = set()
+    for role, number in candidates:
+        number = str(number or "").replace(" ", "").replace("-", "")
+        if number and number not in seen:
+            seen.add(number)
+            recipients.append((role, number))
+    return recipients
+
+
+async def enqueue_fanout(message: Any, station: Optional[Dict[str, Any]] = None,
+                         is_template: str = "custom", priority: int = ROUTINE,
+                         call_id: Optional[str] = None, collection=outbox, keys=alert_keys,
+                         group_id: Optional[str] = None, **details) -> Tuple[str, bool]:
+    """
+    Queue one alert per recipient under a shared group id, for the
+    dispatcher to send concurrently. Returns (group_id, queued): the same
+    words from the same call within DEDUPE_WINDOW are not queued again,
+    and give the first alert's group id.
+    Without a call_id there is nothing to tell callers apart, so every
+    alert is queued.
+    """
+    new_group_id = group_id or str(ObjectId())
+    key = alert_key(call_id, message) if call_id else None
+    if key is not None:
+        group_id = await claim_alert_key(key, new_group_id, keys)
+        if group_id != new_group_id:
+            return group_id, False
+    group_id = new_group_id
+
+    station_id = str(station["_id"]) if station and station.get("_id") is not None else None
+    try:
+        await asyncio.gather(*(
+            enqueue_alert(number, message, is_template, priority, collection,
+                          group_id=group_id, role=role, station_id=station_id, call_id=call_id, **details)
+            for role, number in alert_recipients(station)
+        ))
+    except Exception:
+        # Drop what was queued and the claim, so a retry sends the alert in full
+        try:
+            await collection.delete_many({"group_id": group_id, "status": PENDING})
+            if key is not None:
+                await release_alert_key(key, group_id, keys)
+        except Exception as e:
+            if key is not None:
+                recent_alerts.invalidate(key)
+            logger.error(f"Could not release alert {group_id} after a failed enqueue: {e}")
+        raise
+    return group_id, True
+
+
+async def _abandon_fanout(group_id: str, key: Optional[str], delivered: List[str]):
+    """
+    Once MongoDB answers again, drop whatever a timed-out enqueue left
+    pending for numbers raise_alert reached itself, and give up the claim
+    if it reached nobody, so a retry is not taken for a duplicate
+    """
+    try:
+        await outbox.delete_many({"group_id": group_id, "status": PENDING, "phone_number": {"$in": delivered}})
+        if key is not None and not delivered:
+            await release_alert_key(key, group_id)
+    except Exception as e:
+        logger.error(f"Could not clean up alert {group_id} after a failed enqueue: {e}")
+
+
+# What the tools tell the caller for each raise_alert outcome
+ALERT_REPLIES = {
+    QUEUED: "alert sended to the officer they will contact you shortly.",
+    SENT: "alert sended to the officer they will contact you shortly.",
+    DUPLICATE: "alert already sent to the officer they will contact you shortly.",
+    FAILED: "alert could not be sent right now, please call 112 directly.",
+}
+
+# Cleanups still running, kept so they are not garbage collected mid-way
+_cleanups = set()
+
+
+async def raise_alert(message: Any, station: Optional[Dict[str, Any]] = None,
+                      is_template: str = "custom", priority: int = ROUTINE,
+                      call_id: Optional[str] = None, timeout: float = ENQUEUE_TIMEOUT) -> Tuple[str, str]:
+    """
+    enqueue_fanout() for a tool answering a caller: when MongoDB does not
+    take the alert within timeout, it is sent straight to every recipient
+    instead. Returns (group_id, QUEUED, DUPLICATE, SENT or FAILED).
+    """
+    group_id = str(ObjectId())
+    try:
+        group_id, queued = await asyncio.wait_for(
+            enqueue_fanout(message, station, is_template, priority, call_id, group_id=group_id), timeout)
+        return group_id, QUEUED if queued else DUPLICATE
+    except Exception as e:
+        logger.error(f"Could not queue alert {group_id}, sending it directly: {e}")
+
+    recipients = alert_recipients(station)
+    results = await asyncio.gather(*(
+        send_whatsapp_message(phone_number=number, message=message, is_template=is_template)
+        for _, number in recipients
+    ), return_exceptions=True)
+    delivered = [number for (_, number), result in zip(recipients, results) if result is True]
+    key = alert_key(call_id, message) if call_id else None
+    if key is not None and not delivered:
+        recent_alerts.invalidate(key)
+    cleanup = asyncio.ensure_future(_abandon_fanout(group_id, key, delivered))
+    _cleanups.add(cleanup)
+    cleanup.add_done_callback(_cleanups.discard)
+    return group_id, SENT if delivered else FAILED
+
+
+class AlertDispatcher:
+    """
+    Background tasks that claim due alerts from the outbox, most urgent
+    first, and send them. A failed send goes back to pending with a
+    growing delay until MAX_ATTEMPTS, then stays failed.
+    """
+
+    def __init__(self, collection=outbox, send=send_whatsapp_message, workers=WORKERS, limiter=send_limiter):
+        self.collection = collection
+        self.send = send
+        self.limiter = limiter
+        self.workers = workers
+        self._tasks = []
+        self._wakeups = []
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    @property
+    def running(self):
+        return bool(self._tasks)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._wakeups = [asyncio.Event() for _ in range(self.workers + 1)]
+        self._tasks = [asyncio.ensure_future(self._work(self._wakeups[0], EMERGENCY))]
+        self._tasks += [asyncio.ensure_future(self._work(wakeup)) for wakeup in self._wakeups[1:]]
+        logger.info(f"Alert dispatcher started with {self.workers} workers and an emergency lane")
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        self._wakeups = []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def wake(self):
+        for wakeup in self._wakeups:
+            wakeup.set()
+
+    async def _claim(self, max_priority=None):
+        current = now()
+        query = {"$or": [
+            {"status": PENDING, "next_attempt_at": {"$lte": current}},
+            {"status": SENDING, "lease_until": {"$lte": current}},
+        ]}
+        if max_priority is not None:
+            query["priority"] = {"$lte": max_priority}
+        return await self.collection.find_one_and_update(
+            query,
+            {"$set": {"status": SENDING, "lease_until": current + timedelta(seconds=LEASE_SECS),
+                      "updated_at": current},
+             "$inc": {"attempts": 1}},
+            sort=[("priority", ASCENDING), ("next_attempt_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _deliver(self, alert):
+        try:
+            # Paced under the API's throughput, so bursts queue here instead of coming back as 429s
+            await self.limiter.acquire()
+            delivered = await self.send(
+                phone_number=alert["phone_number"],
+                message=alert["message"],
+                is_template=alert["is_template"],
+            )
+            error = None if delivered else "not accepted by the WhatsApp API"
+        except Exception as e:
+            delivered, error = False, str(e)
+
+        current = now()
+        if delivered:
+            self.sent += 1
+            update = {"$set": {"status": SENT, "sent_at": current, "updated_at": current},
+                      "$unset": {"lease_until": "", "last_error": ""}}
+        elif alert["attempts"] >= MAX_ATTEMPTS:
+            self.failed += 1
+            logger.error(f"Alert {alert['_id']} failed after {alert['attempts']} attempts: {error}")
+            update = {"$set": {"status": FAILED, "last_error": error, "updated_at": current},
+                      "$unset": {"lease_until": ""}}
+        else:
+            self.retried += 1
+            retry_at = current + timedelta(seconds=retry_delay(alert["attempts"]))
+            update = {"$set": {"status": PENDING, "next_attempt_at": retry_at, "last_error": error,
+                               "updated_at": current},
+                      "$unset": {"lease_until": ""}}
+        await self.collection.update_one({"_id": alert["_id"], "status": SENDING}, update)
+
+    async def _work(self, wakeup, max_priority=None):
+        while True:
+            # Cleared before looking, so an alert queued meanwhile still wakes us
+            wakeup.clear()
+            try:
+                alert = await self._claim(max_priority)
+                if alert is not None:
+                    await self._deliver(alert)
+                    continue
+            except Exception as e:
+                logger.warning(f"Alert outbox unavailable: {e}")
+            try:
+                await asyncio.wait_for(wakeup.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self):
+        return {"running": self.running, "sent": self.sent, "retried": self.retried, "failed": self.failed,
+                "limiter": self.limiter.stats()}
+
+
+dispatcher = AlertDispatcher()
+
+# Lifespans that started the dispatcher and have not stopped it; an MCP
+# server runs its lifespan once per session, so only the last one stops it
+_holders = 0
+
+
+async def start_alert_dispatcher():
+    global _holders
+    _holders += 1
+    if not dispatcher.running:
+        await ensure_outbox_indexes(dispatcher.collection)
+        await ensure_key_indexes()
+        dispatcher.start()
+
+
+async def stop_alert_dispatcher():
+    global _holders
+    _holders = max(_holders - 1, 0)
+    if _holders == 0:
+        await dispatcher.stop()
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by TTLCache.get on a miss, so that None can be cached as a value
+MISSING = object()
+
+
+class TTLCache:
+    """
+    In-process least-recently-used cache whose entries also expire after
+    ttl seconds. Not thread-safe; meant for use from the event loop.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=MISSING):
+        item = self._data.get(key)
+        if item is None or item[1] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Drop one key, or every key when none is given"""
+        if key is None:
+            self._data.clear()
+        else:
+            self._data.pop(key, None)
+
+    def stats(self):
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class SingleFlight:
+    """
+    Collapses concurrent identical coroutine calls into one: callers asking
+    for a key already in flight await the same task instead of starting
+    another. Meant for use from the event loop.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+
+    async def do(self, key, fn, *args):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        # One caller giving up must not cancel the call for the others
+        return await asyncio.shield(task)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ThreadSingleFlight:
+    """SingleFlight for blocking functions called from several threads"""
+
+    def __init__(self):
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
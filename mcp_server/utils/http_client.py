@@ -0,0 +1,297 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Connections kept open across all hosts, and to any one host
+POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", 100))
+POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", 20))
+# Idle keep-alive connections are closed after this long
+KEEPALIVE_SECS = float(os.getenv("HTTP_KEEPALIVE_SECS", 30))
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))
+# Extra attempts after the first, with full-jitter exponential backoff
+RETRIES = int(os.getenv("HTTP_RETRIES", 2))
+BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", 0.2))
+BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", 2))
+
+# Safe to send again whatever happened to the first attempt
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# The server did not act on the request; worth retrying for any method
+THROTTLED_STATUSES = {429}
+# Worth retrying for idempotent methods only
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+LATENCY_SAMPLES = 512
+
+
+def endpoint_name(url: str) -> str:
+    """Default metrics label: host and path, without the query string"""
+    parts = urlsplit(url)
+    return f"{parts.netloc}{parts.path}"
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Full-jitter delay before retry number attempt (0-based), honouring Retry-After up to BACKOFF_MAX"""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    if retry_after:
+        try:
+            delay = max(delay, min(float(retry_after), BACKOFF_MAX))
+        except ValueError:
+            pass
+    return delay
+
+
+def should_retry(method: str, status: Optional[int]) -> bool:
+    """status is None when no response came back at all"""
+    if method.upper() in IDEMPOTENT_METHODS:
+        return status is None or status in RETRY_STATUSES
+    return status in THROTTLED_STATUSES
+
+
+class EndpointStats:
+    """Request count, outcome and recent latencies of one endpoint"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.statuses = {}
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.recent_ms = deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, elapsed_ms, status):
+        self.requests += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.recent_ms.append(elapsed_ms)
+        if status is None:
+            self.errors += 1
+        else:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def snapshot(self):
+        recent = sorted(self.recent_ms)
+
+        def percentile(p):
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))], 1) if recent else None
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "statuses": dict(self.statuses),
+            "mean_ms": round(self.total_ms / self.requests, 1) if self.requests else None,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(self.max_ms, 1),
+        }
+
+
+class HttpMetrics:
+    """Per-endpoint latency and outcome, shared by the blocking and asyncio clients"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def _endpoint(self, endpoint):
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints.setdefault(endpoint, EndpointStats())
+        return stats
+
+    def record(self, endpoint, elapsed_ms, status):
+        with self._lock:
+            self._endpoint(endpoint).record(elapsed_ms, status)
+
+    def record_retry(self, endpoint):
+        with self._lock:
+            self._endpoint(endpoint).retries += 1
+
+    def stats(self):
+        with self._lock:
+            return {endpoint: stats.snapshot() for endpoint, stats in self._endpoints.items()}
+
+
+metrics = HttpMetrics()
+
+
+class AsyncHttpClient:
+    """
+    One aiohttp session for every outbound call of the process, so
+    connections to each host are kept alive and reused. The session is
+    opened by start() or on first use, and must be closed with close().
+    """
+
+    def __init__(self, limit=POOL_LIMIT, limit_per_host=POOL_LIMIT_PER_HOST, timeout=TIMEOUT,
+                 retries=RETRIES):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self._session = None
+
+    async def start(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             keepalive_timeout=KEEPALIVE_SECS, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout, connect=CONNECT_TIMEOUT),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def request(self, method: str, url: str, endpoint: Optional[str] = None,
+                      retries: Optional[int] = None, timeout: Optional[float] = None,
+                      **kwargs) -> Tuple[int, Any]:
+        """
+        Send a request, retrying as should_retry allows, and return
+        (status, body); the body is parsed JSON when the response is JSON,
+        else text. Errors from the last attempt are raised.
+        """
+        session = await self.start()
+        endpoint = endpoint or endpoint_name(url)
+        retries = self.retries if retries is None else retries
+        if timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout, connect=CONNECT_TIMEOUT)
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            status = None
+            try:
+                async with session.request(method, url, **kwargs) as response:
+                    status = response.status
+                    if response.content_type == "application/json":
+                        body = await response.json()
+                    else:
+                        body = await response.text()
+                    retry_after = response.headers.get("Retry-After")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                metrics.record(endpoint, (time.perf_counter() - started) * 1000, None)
+                # A connection that was never made cannot have delivered the request
+                retryable = isinstance(e, aiohttp.ClientConnectorError) or should_retry(method, None)
+                if attempt >= retries or not retryable:
+                    raise
+                retry_after = None
+            else:
+                metrics.record(endpoint, (time.perf_counter() - started) * 1000, status)
+                if attempt >= retries or not should_retry(method, status):
+                    return status, body
+
+            metrics.record_retry(endpoint)
+            await asyncio.sleep(backoff_delay(attempt, retry_after))
+            attempt += 1
+
+    async def get_json(self, url: str, params: Optional[Dict[str, Any]] = None,
+                       endpoint: Optional[str] = None, **kwargs) -> Any:
+        _, body = await self.request("GET", url, endpoint=endpoint, params=params, **kwargs)
+        return body
+
+
+class HttpClient:
+    """AsyncHttpClient for blocking callers, over one pooled requests.Session"""
+
+    def __init__(self, limit_per_host=POOL_LIMIT_PER_HOST, timeout=TIMEOUT, retries=RETRIES):
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self._session = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                # Retries are done here, so the adapter itself never retries
+                adapter = HTTPAdapter(pool_connections=POOL_LIMIT, pool_maxsize=self.limit_per_host,
+                                      max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+
+    def request(self, method: str, url: str, endpoint: Optional[str] = None,
+                retries: Optional[int] = None, timeout: Optional[float] = None,
+                **kwargs) -> Tuple[int, Any]:
+        session = self.start()
+        endpoint = endpoint or endpoint_name(url)
+        retries = self.retries if retries is None else retries
+        kwargs["timeout"] = (CONNECT_TIMEOUT, self.timeout if timeout is None else timeout)
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                metrics.record(endpoint, (time.perf_counter() - started) * 1000, None)
+                # A connect timeout means the request was never sent
+                retryable = isinstance(e, requests.ConnectTimeout) or should_retry(method, None)
+                if attempt >= retries or not retryable:
+                    raise
+                retry_after = None
+            else:
+                metrics.record(endpoint, (time.perf_counter() - started) * 1000, response.status_code)
+                if attempt >= retries or not should_retry(method, response.status_code):
+                    if "application/json" in response.headers.get("Content-Type", ""):
+                        return response.status_code, response.json()
+                    return response.status_code, response.text
+                retry_after = response.headers.get("Retry-After")
+
+            metrics.record_retry(endpoint)
+            time.sleep(backoff_delay(attempt, retry_after))
+            attempt += 1
+
+    def get_json(self, url: str, params: Optional[Dict[str, Any]] = None,
+                 endpoint: Optional[str] = None, **kwargs) -> Any:
+        _, body = self.request("GET", url, endpoint=endpoint, params=params, **kwargs)
+        return body
+
+
+# The process-wide clients every outbound call goes through
+http_client = AsyncHttpClient()
+blocking_http_client = HttpClient()
+
+
+# Lifespans that started the clients and have not closed them yet; an MCP
+# server runs its lifespan once per session, so only the last one closes
+_holders = 0
+
+
+async def start_http_clients():
+    global _holders
+    _holders += 1
+    await http_client.start()
+    blocking_http_client.start()
+
+
+async def close_http_clients():
+    global _holders
+    _holders = max(_holders - 1, 0)
+    if _holders == 0:
+        await http_client.close()
+        blocking_http_client.close()
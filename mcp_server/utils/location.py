@@ -1,9 +1,21 @@
 import asyncio
+import heapq
+import redis.asyncio as aioredis
 from motor.motor_asyncio import AsyncIOMotorClient
 from bson import ObjectId
+from bson.errors import InvalidId
 import os
 from dotenv import load_dotenv
 from difflib import SequenceMatcher
+from operator import itemgetter
+from .cache import MISSING, TTLCache
+from .normalize import exact_name_query
+from .phonetic import phonetic_form
+from .station_names import listen_for_invalidations
+from .transliterate import is_devanagari, to_latin
+from .village_index import village_index
+from .village_scoring import ScoringPool, ScoringUnavailable, best_village, match_village
+from .village_stations import NEAREST_STATION_FIELD
 
 # Load environment variables
 load_dotenv(dotenv_path="/home/ubuntu/testing/mcp_server/.env")
@@ -16,28 +28,67 @@ DATABASE_NAME = os.getenv("DATABASE_NAME", "rakshak-ai")
 client = AsyncIOMotorClient(MONGO_URI)
 db = client[DATABASE_NAME]
 
+# Police stations rarely change, so they are cached by ObjectId. An edit
+# announced on the station invalidation channel drops the cached copy at
+# once; the TTL bounds how long an unannounced one takes to show
+station_cache = TTLCache(
+    maxsize=int(os.getenv("STATION_CACHE_SIZE", 1024)),
+    ttl=int(os.getenv("STATION_CACHE_TTL", 600)),
+)
+
+# Carries the station invalidations; does not connect until the listener starts
+redis_client = aioredis.Redis(
+    host=os.getenv("REDIS_HOST", "localhost"),
+    port=int(os.getenv("REDIS_PORT", 6379)),
+    password=os.getenv("REDIS_PASSWORD", ""),
+    decode_responses=True,
+    socket_connect_timeout=5,
+)
+station_listener = None
+
+# Fuzzy scans are CPU-bound, so they run off the event loop
+scoring_pool = ScoringPool(village_index)
+
 def similar(a, b):
     """Check similarity between two strings (0 to 1)"""
     return SequenceMatcher(None, a.lower(), b.lower()).ratio()
 
-async def find_village_fuzzy(village_name, threshold=0.7):
-    """Find village with fuzzy matching for spelling mistakes"""
+async def init_village_index():
+    """Load the village index and keep it, and the cached stations, in sync with MongoDB"""
     villages = db["villages"]
+    await village_index.ensure_loaded(villages)
+    village_index.start(villages)
+    await scoring_pool.start()
+    start_station_listener()
+
+async def find_village_phonetic(village_name, threshold=0.7):
+    """Resolve phonetic spelling variants with a bucket lookup instead of a scan"""
+    await village_index.ensure_loaded(db["villages"])
+    form = phonetic_form(village_name)
+    candidates = village_index.phonetic_bucket(form)
+    if not candidates:
+        return None, 0
     
-    # Get ALL villages first
-    all_villages = await villages.find().to_list(length=None)
-    
-    # Find the best match
-    best_match = None
-    best_score = 0
+    # The same folded spelling is a match outright; sharing only the stem
+    # must also be similar enough, so Devgaon never resolves to Devnagar
+    same_form = [village for village in candidates if village["phonetic"] == form]
+    village, score = best_village(village_name.lower(), same_form or candidates)
+    if same_form or score >= threshold:
+        return village, score
+    return None, score
+
+async def find_village_fuzzy(village_name, threshold=0.7):
+    """Find village with fuzzy matching for spelling mistakes"""
+    # Scan the resident index instead of pulling the collection per query
+    await village_index.ensure_loaded(db["villages"])
+    query = village_name.lower()
     
-    for village in all_villages:
-        db_village_name = village.get("villagename", "")
-        score = similar(village_name, db_village_name)
-        
-        if score > best_score:
-            best_score = score
-            best_match = village
+    try:
+        best_match, best_score = await scoring_pool.match(query, threshold)
+    except ScoringUnavailable as e:
+        # Overloaded: score only the bounded trigram shortlist here
+        print(f"Village scorer unavailable ({e}), using the shortlist only")
+        best_match, best_score = match_village(village_index, query, threshold, verify=False)
     
     # Return if similarity is above threshold
     if best_score >= threshold:
@@ -45,15 +96,160 @@ async def find_village_fuzzy(village_name, threshold=0.7):
     else:
         return None, best_score
 
+def to_object_id(station_id):
+    """ObjectId for a stored stationId, or None if it is missing or malformed"""
+    if station_id is None:
+        return None
+    try:
+        return ObjectId(station_id)
+    except (InvalidId, TypeError):
+        return None
+
+def invalidate_station(station_id=None):
+    """Drop one cached police station after it is edited, or all of them"""
+    station_cache.invalidate(None if station_id is None else to_object_id(station_id))
+
+def _station_changed(data):
+    # A message that is not one station's _id may concern any of them
+    station_cache.invalidate(to_object_id(data))
+
+def start_station_listener():
+    """Drop cached stations as edits to them are announced"""
+    global station_listener
+    if station_listener is None or station_listener.done():
+        station_listener = asyncio.ensure_future(listen_for_invalidations(redis_client, _station_changed))
+
 async def get_station(station_id):
     """Get police station by ID"""
-    piusers = db["piusers"]
+    object_id = to_object_id(station_id)
+    if object_id is None:
+        return None
     
-    try:
-        station = await piusers.find_one({"_id": ObjectId(station_id)})
+    station = station_cache.get(object_id)
+    if station is not MISSING:
         return station
-    except:
+    
+    piusers = db["piusers"]
+    try:
+        station = await piusers.find_one({"_id": object_id})
+    except Exception as e:
+        print(f"Station lookup failed for {station_id}: {e}")
         return None
+    if station:
+        station_cache.set(object_id, station)
+    return station
+
+async def get_stations(station_ids):
+    """Get police stations for several IDs in one query, keyed by the given IDs"""
+    object_ids = {}
+    for station_id in station_ids:
+        object_id = to_object_id(station_id)
+        if object_id is not None:
+            object_ids[station_id] = object_id
+    
+    by_id = {}
+    missing = set()
+    for object_id in object_ids.values():
+        station = station_cache.get(object_id)
+        if station is MISSING:
+            missing.add(object_id)
+        else:
+            by_id[object_id] = station
+    
+    if missing:
+        piusers = db["piusers"]
+        try:
+            stations = await piusers.find({"_id": {"$in": list(missing)}}).to_list(length=None)
+        except Exception as e:
+            print(f"Station lookup failed for {len(missing)} stations: {e}")
+            stations = []
+        for station in stations:
+            station_cache.set(station["_id"], station)
+            by_id[station["_id"]] = station
+    
+    return {station_id: by_id.get(object_id) for station_id, object_id in object_ids.items()}
+
+async def find_village_with_station(query):
+    """
+    Find one village matching the query together with its police station
+    in a single aggregation, caching the station for later lookups
+    
+    Returns: (village_data, station_data)
+    """
+    villages = db["villages"]
+    pipeline = [
+        {"$match": query},
+        {"$limit": 1},
+        # stationId may be stored as a string or an ObjectId; villages without
+        # one use the nearest station precomputed by village_stations
+        {"$addFields": {"stationObjectId": {"$convert": {
+            "input": {"$ifNull": ["$stationId", f"${NEAREST_STATION_FIELD}"]},
+            "to": "objectId", "onError": None, "onNull": None,
+        }}}},
+        {"$lookup": {
+            "from": "piusers",
+            "localField": "stationObjectId",
+            "foreignField": "_id",
+            "as": "station",
+        }},
+    ]
+    
+    results = await villages.aggregate(pipeline).to_list(length=1)
+    if not results:
+        return None, None
+    
+    village = results[0]
+    village.pop("stationObjectId", None)
+    stations = village.pop("station", [])
+    station = stations[0] if stations else None
+    if station:
+        station_cache.set(station["_id"], station)
+    return village, station
+
+async def search_village_topk(village_name, k=5):
+    """
+    Search the k villages most similar to the name, with their police stations
+    
+    Returns: ([(village_data, station_data, similarity_score), ...], margin)
+    best first, where margin is how far the best score leads the second.
+    Spellings identical in Devanagari or after phonetic folding score 1.0
+    """
+    if not village_name or not village_name.strip():
+        return [], 0
+    
+    village_name = village_name.strip()
+    await village_index.ensure_loaded(db["villages"])
+    
+    exact = []
+    if is_devanagari(village_name):
+        exact = village_index.devanagari_matches(village_name)
+        village_name = to_latin(village_name)
+    query = village_name.lower()
+    
+    # Trigram shortlist plus the phonetic bucket, scored once and partially sorted;
+    # the same Devanagari or folded phonetic spelling counts as an exact match
+    form = phonetic_form(village_name)
+    candidates = {village["_id"]: village for village in village_index.shortlist(query)}
+    for village in village_index.phonetic_bucket(form):
+        candidates[village["_id"]] = village
+        if village["phonetic"] == form:
+            exact.append(village)
+    exact_ids = {village["_id"] for village in exact}
+    for village in exact:
+        candidates[village["_id"]] = village
+    
+    scored = (
+        (1.0 if _id in exact_ids else SequenceMatcher(None, query, village["norm"]).ratio(), village)
+        for _id, village in candidates.items()
+    )
+    top = heapq.nlargest(k, scored, key=itemgetter(0))
+    if not top:
+        return [], 0
+    
+    stations = await get_stations([village.get("stationId") for _, village in top])
+    matches = [(village, stations.get(village.get("stationId")), score) for score, village in top]
+    margin = top[0][0] - top[1][0] if len(top) > 1 else top[0][0]
+    return matches, margin
 
 async def search_village_fuzzy(village_name):
     """
@@ -65,19 +261,28 @@ async def search_village_fuzzy(village_name):
         return None, None, 0
     
     village_name = village_name.strip()
-    
-    # Try exact match first (fastest)
     villages = db["villages"]
-    exact_match = await villages.find_one({
-        "villagename": {"$regex": f"^{village_name}$", "$options": "i"}
-    })
+    
+    # Devanagari straight from STT: exact script match, else its romanized form
+    if is_devanagari(village_name):
+        await village_index.ensure_loaded(villages)
+        matches = village_index.devanagari_matches(village_name)
+        if matches:
+            station = await get_station(matches[0].get("stationId"))
+            return matches[0], station, 1.0
+        village_name = to_latin(village_name)
+    
+    # Try exact match first (fastest): an indexed equality on the stored
+    # normalized name, fetching the station in the same query
+    exact_match, station = await find_village_with_station(exact_name_query("villages", village_name))
     
     if exact_match:
-        station = await get_station(exact_match.get("stationId"))
         return exact_match, station, 1.0
     
-    # If no exact match, try fuzzy search
-    village, score = await find_village_fuzzy(village_name)
+    # Then phonetic variants, and only then the fuzzy search
+    village, score = await find_village_phonetic(village_name)
+    if not village:
+        village, score = await find_village_fuzzy(village_name)
     
     if village:
         print(f"Found similar village: {village['villagename']} (Score: {score:.2f})")
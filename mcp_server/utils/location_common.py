@@ -0,0 +1,369 @@
+import heapq
+import json
+import math
+import os
+import re
+from difflib import SequenceMatcher
+from functools import lru_cache
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Tuple
+
+from .normalize import normalize_name
+from .phonetic import phonetic_form
+from .transliterate import to_devanagari, to_latin
+
+# Shared by the blocking and asyncio location search modules, so the two
+# send the same prompts and build the same results
+
+# Cache constants
+CACHE_TTL = 5 * 60  # 5 minutes in seconds
+POLICE_STATIONS_CACHE_KEY = "police_station_names"
+
+GPT_MODEL = "gpt-3.5-turbo"
+
+# Resolved names and location lookups, cached in-process and in Redis
+LOCATION_CACHE_SIZE = int(os.getenv("LOCATION_CACHE_SIZE", 2048))
+LOCATION_CACHE_TTL = int(os.getenv("LOCATION_CACHE_TTL", 6 * 60 * 60))
+# Misses are kept briefly, so a new station or a passing outage heals quickly
+LOCATION_CACHE_NEGATIVE_TTL = int(os.getenv("LOCATION_CACHE_NEGATIVE_TTL", 5 * 60))
+
+# Places responses change slowly; ZERO_RESULTS is kept for the shorter TTL
+MAPS_CACHE_TTL = int(os.getenv("MAPS_CACHE_TTL", 7 * 24 * 60 * 60))
+MAPS_CACHE_NEGATIVE_TTL = int(os.getenv("MAPS_CACHE_NEGATIVE_TTL", 60 * 60))
+# Nearby searches within one geohash cell share a result; 7 is about 150 m
+MAPS_GEOHASH_PRECISION = int(os.getenv("MAPS_GEOHASH_PRECISION", 7))
+# Other statuses (quota, denied, server errors) are never cached
+MAPS_CACHEABLE_STATUSES = {"OK", "ZERO_RESULTS"}
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Words that say "police station" rather than name one
+STATION_WORDS = {"police", "station", "ps", "thana", "chowki", "polis", "pos"}
+# A local fuzzy match must score this well and lead the runner-up by the
+# margin before the LLM is skipped
+STATION_MATCH_THRESHOLD = float(os.getenv("STATION_MATCH_THRESHOLD", 0.85))
+STATION_MATCH_MARGIN = float(os.getenv("STATION_MATCH_MARGIN", 0.05))
+# Best ranked names the LLM chooses from when no local match is confident
+STATION_SHORTLIST_SIZE = int(os.getenv("STATION_SHORTLIST_SIZE", 5))
+
+PLACES_FIND_URL = "https://maps.googleapis.com/maps/api/place/findplacefromtext/json"
+PLACES_NEARBY_URL = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+PLACES_DETAILS_URL = "https://maps.googleapis.com/maps/api/place/details/json"
+
+# Nearby "police" results that are not police stations
+EXCLUDED_KEYWORDS = [
+    "academy", "training", "school", "college", "shop", "store",
+    "market", "mall", "restaurant", "hotel", "resort", "club",
+    "bar", "cafe", "zep", "garud", "outpost", "checkpost"
+]
+
+class LocationResult:
+    def __init__(self, display_name: str, lat: float, lon: float,
+                 nearest_police_station: Dict[str, Any] = None):
+        self.display_name = display_name
+        self.lat = lat
+        self.lon = lon
+        self.nearest_police_station = nearest_police_station or {}
+
+class LocationNotFound(Exception):
+    """Neither our stations nor Google Maps know the place, as opposed to a lookup that failed"""
+
+def policy_response() -> Dict[str, Any]:
+    return {
+        "message": "Policy message here",
+        "next_state": "LANGUAGE_SELECTION",
+        "is_template": "interactive"
+    }
+
+def location_response(location_name: str, location_details: LocationResult) -> Dict[str, Any]:
+    return {
+        "data": {
+            "location": {
+                "name": location_name,
+                "coordinates": {
+                    "lat": location_details.lat,
+                    "long": location_details.lon,
+                }
+            },
+            "nearest_police_station": location_details.nearest_police_station
+        }
+    }
+
+def outside_jurisdiction_response(language: str) -> Dict[str, Any]:
+    error_message = (
+        "The location you entered is outside the jurisdiction of Nashik Gramin Police.\n"
+        if language == "english"
+        else "आपण दिलेले ठिकाण नाशिक ग्रामीण पोलीसांच्या कार्यक्षेत्राबाहेर आहे.\n"
+             "कृपया आमच्या कार्यक्षेत्रातील वैध ठिकाण प्रविष्ट करा"
+    )
+    return {
+        "message": error_message,
+        "next_state": "LOCATION"
+    }
+
+def station_location_result(matched_station: Dict[str, Any]) -> LocationResult:
+    """LocationResult for a piusers document, raising if it has no coordinates"""
+    if not matched_station.get("location") or not matched_station["location"].get("coordinates"):
+        raise Exception("Police station coordinates not available")
+
+    coordinates = matched_station["location"]["coordinates"]
+    if not coordinates or len(coordinates) < 2:
+        raise Exception("Invalid coordinates")
+
+    longitude, latitude = coordinates[0], coordinates[1]
+
+    return LocationResult(
+        display_name=matched_station.get("stationName", ""),
+        lat=latitude,
+        lon=longitude,
+        nearest_police_station={
+            "_id": str(matched_station.get("_id")),
+            "email": matched_station.get("email"),
+            "fullName": matched_station.get("fullName"),
+            "stationName": matched_station.get("stationName"),
+            "address": matched_station.get("address"),
+            "officersmobNumber": matched_station.get("mobNumber"),
+            "stationMobNumber": matched_station.get("stationMobNumber"),
+            "latitude": latitude,
+            "longitude": longitude,
+            "source": "database"
+        }
+    )
+
+def fallback_station(latitude: float, longitude: float, station_name: str, address: str, source: str) -> Dict[str, Any]:
+    return {
+        "stationName": station_name,
+        "address": address,
+        "latitude": latitude,
+        "longitude": longitude,
+        "source": source
+    }
+
+def valid_police_stations(places: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Nearby search results that look like actual police stations"""
+    stations = []
+    for place in places:
+        name = place.get('name', '').lower()
+        types = place.get('types', [])
+
+        is_excluded = any(keyword in name for keyword in EXCLUDED_KEYWORDS)
+        is_police_station = ('police' in name or 'police' in types)
+
+        if is_police_station and not is_excluded:
+            stations.append(place)
+    return stations
+
+def database_station(db_station: Dict[str, Any], station_location: Dict[str, float]) -> Dict[str, Any]:
+    coordinates = db_station.get("location", {}).get("coordinates", [])
+    longitude, latitude = coordinates[0], coordinates[1] if coordinates else (station_location['lng'], station_location['lat'])
+
+    return {
+        "_id": str(db_station.get("_id")),
+        "email": db_station.get("email"),
+        "fullName": db_station.get("fullName"),
+        "stationName": db_station.get("stationName"),
+        "address": db_station.get("address"),
+        "officersmobNumber": db_station.get("mobNumber"),
+        "stationMobNumber": db_station.get("stationMobNumber"),
+        "latitude": latitude,
+        "longitude": longitude,
+    }
+
+def google_station(station_name: str, station_details: Dict[str, Any], station_location: Dict[str, float]) -> Dict[str, Any]:
+    return {
+        "stationName": station_name,
+        "address": station_details.get('formatted_address', 'Address not available'),
+        "stationMobNumber": station_details.get('formatted_phone_number', 'Phone not available'),
+        "website": station_details.get('website', ''),
+        "latitude": station_location['lat'],
+        "longitude": station_location['lng'],
+    }
+
+@lru_cache(maxsize=1)
+def station_name_forms(station_names) -> Dict[str, str]:
+    """
+    Map the Devanagari and romanized forms of every police station name to the stored name
+    """
+    forms = {}
+    for name in station_names:
+        forms[to_devanagari(name)] = name
+        forms[to_latin(name).lower()] = name
+    return forms
+
+def station_key(name: str) -> str:
+    """Normalized place part of a station name, so "Ozar P.S." and "ओझर पोलीस ठाणे" share a key"""
+    words = re.sub(r"[^a-z0-9 ]", " ", normalize_name(name)).split()
+    return " ".join(word for word in words if word not in STATION_WORDS)
+
+@lru_cache(maxsize=1)
+def station_name_keys(station_names):
+    """
+    (key -> name, phonetic form -> names) for the station names, so spelling
+    variants like Ojhar/Ozar or Wani/Vani resolve without scoring
+    """
+    keys = {}
+    phonetic = {}
+    for name in station_names:
+        key = station_key(name)
+        if key:
+            keys.setdefault(key, name)
+            phonetic.setdefault(phonetic_form(key), set()).add(name)
+    return keys, phonetic
+
+def token_set_ratio(a: str, b: str) -> float:
+    """
+    Similarity of two keys as word sets, so word order and extra words on
+    one side ("pimpalgaon" against "pimpalgaon baswant") cost little
+    """
+    words_a, words_b = set(a.split()), set(b.split())
+    common = " ".join(sorted(words_a & words_b))
+    only_a = " ".join(sorted(words_a - words_b))
+    only_b = " ".join(sorted(words_b - words_a))
+    if not common:
+        return SequenceMatcher(None, only_a, only_b).ratio()
+    with_a = f"{common} {only_a}".strip()
+    with_b = f"{common} {only_b}".strip()
+    return max(
+        SequenceMatcher(None, common, with_a).ratio(),
+        SequenceMatcher(None, common, with_b).ratio(),
+        SequenceMatcher(None, with_a, with_b).ratio(),
+    )
+
+def rank_station_names(key: str, station_names: List[str], limit: int = STATION_SHORTLIST_SIZE) -> List[Tuple[float, str]]:
+    """The limit best (score, name) pairs for a station key over every station name"""
+    keys, _ = station_name_keys(tuple(station_names))
+    # Token-set similarity forgives word order and extra words; averaging it
+    # with the sorted-words ratio still ranks the name covering every word first
+    sorted_key = " ".join(sorted(key.split()))
+    scored = (
+        ((token_set_ratio(key, candidate)
+          + SequenceMatcher(None, sorted_key, " ".join(sorted(candidate.split()))).ratio()) / 2, name)
+        for candidate, name in keys.items()
+    )
+    return heapq.nlargest(limit, scored, key=itemgetter(0))
+
+def match_station_name(text: str, station_names: List[str]) -> Tuple[Optional[str], List[str]]:
+    """
+    (match, shortlist). match is the stored station name when a local match
+    is confident: the same place key, one station with the same phonetic
+    form, or a ranked match that clearly beats every other station.
+    Otherwise it is None and shortlist holds the best ranked names for the
+    LLM to choose from.
+    """
+    key = station_key(text)
+    if not key or not station_names:
+        return None, []
+
+    keys, phonetic = station_name_keys(tuple(station_names))
+    if key in keys:
+        return keys[key], []
+    same_sound = phonetic.get(phonetic_form(key), ())
+    if len(same_sound) == 1:
+        return next(iter(same_sound)), []
+
+    ranked = rank_station_names(key, station_names)
+    best_score = ranked[0][0] if ranked else 0
+    runner_up = ranked[1][0] if len(ranked) > 1 else 0
+    if best_score >= STATION_MATCH_THRESHOLD and best_score - runner_up >= STATION_MATCH_MARGIN:
+        return ranked[0][1], []
+    return None, [name for _, name in ranked]
+
+def resolver_messages(text: str, station_names: List[str]) -> List[Dict[str, str]]:
+    """One prompt that both translates the input and picks among the shortlisted stations"""
+    return [
+        {
+            "role": "system",
+            "content": f"""
+            You resolve what a caller said into a police station name.
+            The input may be Marathi or Hindi, romanized, misspelled, or use abbreviations (PS, Thana, Chowki).
+
+            Reply with a JSON object with two keys:
+            "translation": the place the caller named, in English script, without explanations.
+            "station": the exact name from the list below if one confidently matches, otherwise "".
+
+            Candidate station names: {", ".join(station_names)}
+            """
+        },
+        {
+            "role": "user",
+            "content": text
+        }
+    ]
+
+def parse_resolution(content: str, all_station_names: List[str], text: str) -> Tuple[str, bool]:
+    """
+    (name, matched): the listed station from a resolver reply, else its
+    translation, else the text, with matched False in the latter two cases
+    """
+    try:
+        reply = json.loads(content)
+    except (TypeError, ValueError):
+        return text, False
+    if not isinstance(reply, dict):
+        return text, False
+    station = reply.get("station")
+    if station and station in all_station_names:
+        return station, True
+    return (reply.get("translation") or "").strip() or text, False
+
+def cache_key(*parts: str) -> str:
+    """Result cache key: spelling and script variants of the same input share one"""
+    return "|".join(normalize_name(part) for part in parts)
+
+def clean_location_name(location_name: str) -> str:
+    """
+    Clean and normalize location name for database search
+    """
+    return (
+        location_name.strip()
+        .lower()
+        .replace("  ", " ")
+        .replace("police", "")
+        .replace("station", "")
+        .replace("ps", "")
+        .replace("thana", "")
+        .replace("chowki", "")
+        .strip()
+    )
+
+def geohash(latitude: float, longitude: float, precision: int = MAPS_GEOHASH_PRECISION) -> str:
+    """Standard base32 geohash of a point"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        bounds, point = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if point >= middle:
+            value |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Calculate distance between two coordinates using Haversine formula
+    """
+    R = 6371  # Earth's radius in kilometers
+    d_lat = math.radians(lat2 - lat1)
+    d_lon = math.radians(lon2 - lon1)
+
+    a = (math.sin(d_lat / 2) * math.sin(d_lat / 2) +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
+         math.sin(d_lon / 2) * math.sin(d_lon / 2))
+
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    distance = R * c * 1000  # Convert to meters
+
+    return round(distance)
@@ -1,13 +1,31 @@
 import os
-import math
 import redis
 import json
-import requests
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Any, Tuple
 from openai import OpenAI
 from pymongo import MongoClient
 import logging
 import re
+from concurrent.futures import ThreadPoolExecutor
+from .location_common import (
+    CACHE_TTL, GPT_MODEL, LOCATION_CACHE_NEGATIVE_TTL, LOCATION_CACHE_SIZE, LOCATION_CACHE_TTL,
+    MAPS_CACHE_NEGATIVE_TTL, MAPS_CACHE_TTL, MAPS_CACHEABLE_STATUSES, PLACES_DETAILS_URL,
+    PLACES_FIND_URL, PLACES_NEARBY_URL, POLICE_STATIONS_CACHE_KEY, LocationNotFound, LocationResult,
+    cache_key, clean_location_name, database_station, fallback_station, geohash,
+    google_station, location_response, match_station_name, outside_jurisdiction_response,
+    parse_resolution, policy_response, resolver_messages, station_location_result,
+    station_name_forms, valid_police_stations,
+)
+from .cache import MISSING, ThreadSingleFlight
+from .http_client import blocking_http_client
+from .normalize import exact_name_query
+from .station_index import (
+    GOOGLE_FALLBACK, MAX_DISTANCE, STATION_PROJECTION, STATIONS_WITH_COORDINATES,
+    StationIndex, nearest_station_result,
+)
+from .station_names import StationNamesCache, publish_invalidation
+from .tiered_cache import RedisBreaker, TieredCache
+from .transliterate import is_devanagari, to_latin
 # from dotenv import load_dotenv
 
 # load_dotenv(dotenv_path="/home/ubuntu/voice-agent/src/.env")
@@ -21,92 +39,157 @@ GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 MONGO_URI = os.getenv("MONGO_URI")
 
-# Initialize clients
+# None of these connect until first used; call warm_up() to pay that cost up front
 openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
 
-# Initialize Redis with connection handling
-redis_client = None
-try:
-    redis_client = redis.Redis(
-        host=os.getenv("REDIS_HOST", "localhost"),
-        port=int(os.getenv("REDIS_PORT", 6379)),
-        password=os.getenv("REDIS_PASSWORD", ""),
-        decode_responses=True,
-        ssl=False,
-        socket_connect_timeout=5,
-        socket_timeout=5
-    )
-    redis_client.ping()
-    logger.info("Redis connected successfully")
-except (redis.ConnectionError, redis.AuthenticationError) as e:
-    logger.warning(f"Redis connection failed: {e}")
-    redis_client = None
-
-# Initialize MongoDB
-mongo_client = None
-db = None
-pi_users = None
-sp_users = None
-
-try:
-    mongo_client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-    mongo_client.admin.command('ping')
-    mongo_client.admin.command('ping')
-    db = mongo_client["rakshak-ai"]
-    pi_users = db["piusers"]  # Use string access to be safe
-    sp_users = db["spusers"]  # Use string access to be safe
-    logger.info("MongoDB connected successfully")
-    
-    # Test collections exist
-    pi_count = pi_users.count_documents({})
-    sp_count = sp_users.count_documents({})
-    logger.info(f"Found {pi_count} pi_users and {sp_count} sp_users in database")
-except Exception as e:
-    logger.error(f"MongoDB connection failed: {e}")
-    mongo_client = None
-    db = None
-    pi_users = None
-    sp_users = None
-
-# Cache constants
-CACHE_TTL = 5 * 60  # 5 minutes in seconds
-POLICE_STATIONS_CACHE_KEY = "police_station_names"
-
-class LocationResult:
-    def __init__(self, display_name: str, lat: float, lon: float, 
-                 nearest_police_station: Dict[str, Any] = None):
-        self.display_name = display_name
-        self.lat = lat
-        self.lon = lon
-        self.nearest_police_station = nearest_police_station or {}
+redis_client = redis.Redis(
+    host=os.getenv("REDIS_HOST", "localhost"),
+    port=int(os.getenv("REDIS_PORT", 6379)),
+    password=os.getenv("REDIS_PASSWORD", ""),
+    decode_responses=True,
+    ssl=False,
+    socket_connect_timeout=5,
+    socket_timeout=5
+)
+
+mongo_client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000, connect=False) if MONGO_URI else None
+db = mongo_client["rakshak-ai"] if mongo_client is not None else None
+pi_users = db["piusers"] if db is not None else None
+sp_users = db["spusers"] if db is not None else None
+
+# Every Redis user here goes local-only for a while once Redis stops answering
+redis_breaker = RedisBreaker()
+
+# Resolved names and whole lookups, so repeated place names cost no LLM or Maps call
+translation_cache = TieredCache("location:translation", redis_client, LOCATION_CACHE_SIZE,
+                                LOCATION_CACHE_TTL, LOCATION_CACHE_NEGATIVE_TTL, redis_breaker)
+location_cache = TieredCache("location:selection", redis_client, LOCATION_CACHE_SIZE,
+                             LOCATION_CACHE_TTL, LOCATION_CACHE_NEGATIVE_TTL, redis_breaker)
+# Places responses: text search by normalized query, nearby search by geohash
+# cell, details by place_id
+maps_caches = {
+    url: TieredCache(f"maps:{name}", redis_client, LOCATION_CACHE_SIZE, MAPS_CACHE_TTL, MAPS_CACHE_NEGATIVE_TTL,
+                     redis_breaker)
+    for name, url in (("find", PLACES_FIND_URL), ("nearby", PLACES_NEARBY_URL), ("details", PLACES_DETAILS_URL))
+}
+maps_flight = ThreadSingleFlight()
+
+# Police stations by coordinates, for nearest-station queries without Google
+station_index = StationIndex()
+
+def _ping_redis() -> bool:
+    try:
+        redis_client.ping()
+        logger.info("Redis connected successfully")
+        redis_breaker.success()
+        return True
+    except redis.RedisError as e:
+        logger.warning(f"Redis connection failed: {e}")
+        # Caches start local-only rather than each waiting on the connect
+        redis_breaker.failure()
+        return False
+
+def _ping_mongo() -> bool:
+    if mongo_client is None:
+        return False
+    try:
+        mongo_client.admin.command('ping')
+        logger.info("MongoDB connected successfully")
+        return True
+    except Exception as e:
+        logger.error(f"MongoDB connection failed: {e}")
+        return False
+
+def check_connections() -> Dict[str, bool]:
+    """Ping Redis and MongoDB at the same time, logging which are reachable"""
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        redis_ok = executor.submit(_ping_redis)
+        mongo_ok = executor.submit(_ping_mongo)
+        return {"redis": redis_ok.result(), "mongo": mongo_ok.result()}
+
+def warm_up() -> Dict[str, bool]:
+    """
+    Connect to Redis and MongoDB and load the station names and station
+    index, so the first caller does not pay for it. Meant to be called once
+    at process start.
+    """
+    status = check_connections()
+    if status["mongo"]:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            executor.submit(get_all_police_station_names)
+            executor.submit(refresh_station_index)
+    return status
+
+def get_places_json(url: str, params: Dict[str, Any], key: str) -> Dict[str, Any]:
+    """
+    Places API response from the cache, or fetched once however many threads
+    ask for the same key at the same time
+    """
+    cache = maps_caches[url]
+    cached = cache.get(key)
+    if cached is not MISSING:
+        return cached
+    return maps_flight.do(f"{url}|{key}", _fetch_places_json, cache, url, params, key)
+
+def _fetch_places_json(cache: TieredCache, url: str, params: Dict[str, Any], key: str) -> Dict[str, Any]:
+    data = blocking_http_client.get_json(url, params)
+    if data.get('status') in MAPS_CACHEABLE_STATUSES:
+        cache.set(key, data, negative=data['status'] != 'OK')
+    return data
 
 def location_selector(text_input: str, language: str = "english") -> Dict[str, Any]:
     """
     Main function to handle location selection based on text input
     """
     if text_input.strip() in ["0", "०"]:
-        return {
-            "message": "Policy message here",
-            "next_state": "LANGUAGE_SELECTION",
-            "is_template": "interactive"
-        }
-
+        return policy_response()
+
+    key = cache_key(text_input, language)
+    cached = location_cache.get(key)
+    if cached is not MISSING:
+        return cached
+
+    result, cacheable = _select_location(text_input, language)
+    # Only a database hit or a place nobody knows is cached, the latter as
+    # negative so it expires sooner; answers reached through a failed
+    # lookup or Google Maps alone are worked out again next time
+    if cacheable:
+        location_cache.set(key, result, negative="data" not in result)
+    return result
+
+def _select_location(text_input: str, language: str) -> Tuple[Dict[str, Any], bool]:
     location_name = text_input
+    matched_station_name = None
+    db_missed = False
+
+    # Devanagari input is transliterated locally; an exact station name needs no GPT call
+    if is_devanagari(location_name):
+        name_forms = get_station_name_forms()
+        location_name = to_latin(location_name.strip())
+        matched_station_name = (
+            name_forms.get(text_input.strip())
+            or name_forms.get(location_name.lower())
+        )
 
     try:
         # Translate and process the location name
-        try:
-            location_name = translate_to_english(location_name)
-            print("location_name "+location_name)
-        except Exception as e:
-            logger.error(f"Language processing failed, continuing with original: {e}")
+        if matched_station_name:
+            location_name = matched_station_name
+        else:
+            try:
+                location_name = translate_to_english(location_name)
+                print("location_name "+location_name)
+            except Exception as e:
+                logger.error(f"Language processing failed, continuing with original: {e}")
 
         # First try to find in our police station database
         try:
             location_details = get_coordinates_from_location_name(location_name)
             logger.info("Found location in database")
+            return location_response(location_name, location_details), True
         except Exception as db_error:
             logger.warning(f"Database search failed: {db_error}, trying Google Maps")
+            db_missed = isinstance(db_error, LocationNotFound)
             # If database search fails, try Google Maps
             location_details = get_location_from_google_maps(location_name)
             
@@ -118,34 +201,16 @@ def location_selector(text_input: str, language: str = "english") -> Dict[str, A
                     # If found in database, use the database result which has complete info
                     location_details = db_location_details
                     logger.info("Successfully found in database after Google Maps search")
+                    return location_response(location_name, location_details), db_missed
                 except Exception as second_db_error:
                     logger.warning(f"Second database search also failed: {second_db_error}, using Google Maps data")
         
-        return {
-            "data": {
-                "location": {
-                    "name": location_name,
-                    "coordinates": {
-                        "lat": location_details.lat,
-                        "long": location_details.lon,
-                    }
-                },
-                "nearest_police_station": location_details.nearest_police_station
-            }
-        }
+        return location_response(location_name, location_details), False
 
     except Exception as e:
         logger.error(f"Location processing error: {e}")
-        error_message = (
-            "The location you entered is outside the jurisdiction of Nashik Gramin Police.\n"
-            if language == "english"
-            else "आपण दिलेले ठिकाण नाशिक ग्रामीण पोलीसांच्या कार्यक्षेत्राबाहेर आहे.\n"
-                 "कृपया आमच्या कार्यक्षेत्रातील वैध ठिकाण प्रविष्ट करा"
-        )
-        return {
-            "message": error_message,
-            "next_state": "LOCATION"
-        }
+        # Cached only when the database and Google Maps both answered that they do not know the place
+        return outside_jurisdiction_response(language), db_missed and isinstance(e, LocationNotFound)
 
 def get_coordinates_from_location_name(location_name: str) -> LocationResult:
     """
@@ -156,44 +221,19 @@ def get_coordinates_from_location_name(location_name: str) -> LocationResult:
             raise Exception("MongoDB connection not available")
 
 
-        # Search for police stations with similar names
-        police_stations = pi_users.find_one({
-                "stationName": {"$regex": location_name, "$options": "i"}
-            })
+        # Indexed exact match on the normalized name first, then stations containing the name
+        police_stations = pi_users.find_one(exact_name_query("piusers", location_name))
+        if not police_stations:
+            police_stations = pi_users.find_one({
+                    "stationName": {"$regex": re.escape(location_name), "$options": "i"}
+                })
 
 
         if not police_stations:
-            raise Exception("No police station found with the given name")
+            raise LocationNotFound("No police station found with the given name")
 
         # Pick the first matching station
-        matched_station = police_stations
-
-        if not matched_station.get("location") or not matched_station["location"].get("coordinates"):
-            raise Exception("Police station coordinates not available")
-
-        coordinates = matched_station["location"]["coordinates"]
-        if not coordinates or len(coordinates) < 2:
-            raise Exception("Invalid coordinates")
-
-        longitude, latitude = coordinates[0], coordinates[1]
-
-        return LocationResult(
-            display_name=matched_station.get("stationName", ""),
-            lat=latitude,
-            lon=longitude,
-            nearest_police_station={
-                "_id": str(matched_station.get("_id")),
-                "email": matched_station.get("email"),
-                "fullName": matched_station.get("fullName"),
-                "stationName": matched_station.get("stationName"),
-                "address": matched_station.get("address"),
-                "officersmobNumber": matched_station.get("mobNumber"),
-                "stationMobNumber": matched_station.get("stationMobNumber"),
-                "latitude": latitude,
-                "longitude": longitude,
-                "source": "database"
-            }
-        )
+        return station_location_result(police_stations)
 
     except Exception as e:
         logger.error(f"Database search error: {e}")
@@ -208,7 +248,7 @@ def get_location_from_google_maps(location_name: str) -> LocationResult:
             raise Exception("Google Maps API key not available")
 
         # Use Google Places API to find the location
-        places_url = f"https://maps.googleapis.com/maps/api/place/findplacefromtext/json"
+        places_url = PLACES_FIND_URL
         params = {
             'input': location_name + " Nashik",
             'inputtype': 'textquery',
@@ -216,10 +256,11 @@ def get_location_from_google_maps(location_name: str) -> LocationResult:
             'key': GOOGLE_MAPS_API_KEY
         }
         
-        response = requests.get(places_url, params=params)
-        data = response.json()
+        data = get_places_json(places_url, params, cache_key(location_name))
 
-        if data['status'] != 'OK' or not data.get('candidates'):
+        if data['status'] == 'ZERO_RESULTS' or (data['status'] == 'OK' and not data.get('candidates')):
+            raise LocationNotFound(f"Google Maps found no place: {data.get('status')}")
+        if data['status'] != 'OK':
             raise Exception(f"Google Maps API error: {data.get('status')}")
 
         candidate = data['candidates'][0]
@@ -259,22 +300,45 @@ def get_location_from_google_maps(location_name: str) -> LocationResult:
         logger.error(f"Google Maps search error: {e}")
         raise e
 
+def refresh_station_index():
+    """Reload the station index from MongoDB once it is stale"""
+    if station_index.stale() and pi_users is not None:
+        try:
+            station_index.build(pi_users.find(STATIONS_WITH_COORDINATES, STATION_PROJECTION))
+            logger.info(f"Station index built with {len(station_index)} stations")
+        except Exception as e:
+            logger.warning(f"Station index refresh failed, keeping {len(station_index)} stations: {e}")
+
+def find_nearest_stations(latitude: float, longitude: float, k: int = 1) -> List[Dict[str, Any]]:
+    """
+    The k police stations nearest to a point from the local station index,
+    nearest first, each with its distance in meters
+    """
+    refresh_station_index()
+    return [nearest_station_result(distance, station)
+            for distance, station in station_index.nearest(latitude, longitude, k)]
+
 def get_nearest_police_station_from_coords(latitude: float, longitude: float) -> Dict[str, Any]:
     """
-    Find nearest police station using Google Places API
+    Find nearest police station from our stations' coordinates, falling back
+    to Google Places API when none is close enough
     """
+    nearest = find_nearest_stations(latitude, longitude)
+    if nearest and nearest[0]["distance"] <= MAX_DISTANCE:
+        return nearest[0]
+    if not GOOGLE_FALLBACK:
+        return fallback_station(latitude, longitude, "Police Station",
+                                "No police station found nearby",
+                                "no_local_station")
+
     try:
         if not GOOGLE_MAPS_API_KEY:
-            return {
-                "stationName": "Unknown Police Station",
-                "address": "Location found but police station details unavailable",
-                "latitude": latitude,
-                "longitude": longitude,
-                "source": "google_maps_fallback"
-            }
+            return fallback_station(latitude, longitude, "Unknown Police Station",
+                                    "Location found but police station details unavailable",
+                                    "google_maps_fallback")
 
         # Search for police stations nearby
-        places_url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+        places_url = PLACES_NEARBY_URL
         params = {
             'location': f'{latitude},{longitude}',
             'radius': 10000,  # 10km radius
@@ -282,61 +346,35 @@ def get_nearest_police_station_from_coords(latitude: float, longitude: float) ->
             'key': GOOGLE_MAPS_API_KEY
         }
         
-        response = requests.get(places_url, params=params)
-        data = response.json()
+        data = get_places_json(places_url, params, geohash(latitude, longitude))
 
         if data['status'] != 'OK' or not data.get('results'):
-            return {
-                "stationName": "Nearest Police Station",
-                "address": "Police station details not available",
-                "latitude": latitude,
-                "longitude": longitude,
-                "source": "google_maps_no_station"
-            }
+            return fallback_station(latitude, longitude, "Nearest Police Station",
+                                    "Police station details not available",
+                                    "google_maps_no_station")
 
         # Filter for actual police stations
-        valid_police_stations = []
-        for place in data['results']:
-            name = place.get('name', '').lower()
-            types = place.get('types', [])
-            
-            # Exclude non-police establishments
-            excluded_keywords = [
-                "academy", "training", "school", "college", "shop", "store",
-                "market", "mall", "restaurant", "hotel", "resort", "club",
-                "bar", "cafe", "zep", "garud", "outpost", "checkpost"
-            ]
-            
-            is_excluded = any(keyword in name for keyword in excluded_keywords)
-            is_police_station = ('police' in name or 'police' in types)
-            
-            if is_police_station and not is_excluded:
-                valid_police_stations.append(place)
-
-        if not valid_police_stations:
-            return {
-                "stationName": "Police Station",
-                "address": "No police station found nearby",
-                "latitude": latitude,
-                "longitude": longitude,
-                "source": "google_maps_no_valid_station"
-            }
+        police_stations = valid_police_stations(data['results'])
+
+        if not police_stations:
+            return fallback_station(latitude, longitude, "Police Station",
+                                    "No police station found nearby",
+                                    "google_maps_no_valid_station")
 
         # Get the nearest one
-        nearest_station = valid_police_stations[0]
+        nearest_station = police_stations[0]
         station_location = nearest_station['geometry']['location']
         
         # Get more details
         place_id = nearest_station['place_id']
-        details_url = "https://maps.googleapis.com/maps/api/place/details/json"
+        details_url = PLACES_DETAILS_URL
         details_params = {
             'place_id': place_id,
             'fields': 'name,formatted_address,formatted_phone_number,website',
             'key': GOOGLE_MAPS_API_KEY
         }
         
-        details_response = requests.get(details_url, params=details_params)
-        details_data = details_response.json()
+        details_data = get_places_json(details_url, details_params, place_id)
         
         station_details = details_data.get('result', {}) if details_data.get('status') == 'OK' else {}
 
@@ -346,293 +384,146 @@ def get_nearest_police_station_from_coords(latitude: float, longitude: float) ->
             if pi_users is not None:
                 db_station = pi_users.find_one({
                     "$or": [
-                        {"stationName": {"$regex": station_name, "$options": "i"}},
-                        {"stationName": {"$regex": clean_location_name(station_name), "$options": "i"}}
+                        exact_name_query("piusers", station_name),
+                        {"stationName": {"$regex": re.escape(station_name), "$options": "i"}},
+                        {"stationName": {"$regex": re.escape(clean_location_name(station_name)), "$options": "i"}}
                     ]
                 })
                 
                 if db_station:
                     logger.info(f"Found police station in database: {db_station.get('stationName')}")
-                    coordinates = db_station.get("location", {}).get("coordinates", [])
-                    longitude, latitude = coordinates[0], coordinates[1] if coordinates else (station_location['lng'], station_location['lat'])
-                    
-                    return {
-                        "_id": str(db_station.get("_id")),
-                        "email": db_station.get("email"),
-                        "fullName": db_station.get("fullName"),
-                        "stationName": db_station.get("stationName"),
-                        "address": db_station.get("address"),
-                        "officersmobNumber": db_station.get("mobNumber"),
-                        "stationMobNumber": db_station.get("stationMobNumber"),
-                        "latitude": latitude,
-                        "longitude": longitude,
-                    }
+                    return database_station(db_station, station_location)
         except Exception as db_error:
             logger.warning(f"Could not find police station in database: {db_error}")
 
-        return {
-            "stationName": station_name,
-            "address": station_details.get('formatted_address', 'Address not available'),
-            "stationMobNumber": station_details.get('formatted_phone_number', 'Phone not available'),
-            "website": station_details.get('website', ''),
-            "latitude": station_location['lat'],
-            "longitude": station_location['lng'],
-        }
+        return google_station(station_name, station_details, station_location)
 
     except Exception as e:
         logger.error(f"Error finding nearest police station: {e}")
-        return {
-            "stationName": "Police Station",
-            "address": "Error retrieving police station details",
-            "latitude": latitude,
-            "longitude": longitude,
-            "source": "error"
-        }
-
-def clean_location_name(location_name: str) -> str:
-    """
-    Clean and normalize location name for database search
-    """
-    return (
-        location_name.strip()
-        .lower()
-        .replace("  ", " ")
-        .replace("police", "")
-        .replace("station", "")
-        .replace("ps", "")
-        .replace("thana", "")
-        .replace("chowki", "")
-        .strip()
-    )
+        return fallback_station(latitude, longitude, "Police Station",
+                                "Error retrieving police station details",
+                                "error")
 
 def translate_to_english(text: str) -> str:
     """
-    Translate text to English and correct police station names
+    Resolve text to a police station name, or its English form if no station
+    matches. Results are cached; on a miss, local matching against the
+    cached station names is tried first, and only when it is not confident
+    does a single LLM call translate and pick the station together.
     """
-    try:
-        if not openai_client:
-            logger.warning("OpenAI client not available, returning original text")
-            return text
-
-        # First, correct the police station name format
-        corrected_input = correct_police_station_format(text)
-
-        # Check if translation is still needed after correction
-        if not needs_translation(corrected_input):
-            final_corrected_name = correct_police_station_name_with_gpt(corrected_input)
-            return final_corrected_name or corrected_input
-
-        # Use OpenAI for translation
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a translation assistant. Translate the given text into English script only if it is written in Marathi or Hindi, or if it contains spelling mistakes. Return only the corrected translation, without any explanations or extra text."
-                },
-                {
-                    "role": "user",
-                    "content": corrected_input
-                }
-            ]
-        )
-        
-        translation = response.choices[0].message.content.strip()
-
-        # Final correction using GPT with all police station names
-        final_corrected_name = correct_police_station_name_with_gpt(translation)
-        return final_corrected_name or translation
+    # Devanagari is romanized locally rather than by the translation model
+    text = to_latin(text)
+    key = cache_key(text)
+    cached = translation_cache.get(key)
+    if cached is not MISSING:
+        return cached
 
+    try:
+        name, matched = _resolve_station_name(text)
     except Exception as e:
         logger.error(f"Translation error: {e}")
         return text
 
-def get_all_police_station_names() -> List[str]:
+    # Names served stale after an invalidation would put the old answer back
+    if station_names.status() == "fresh":
+        translation_cache.set(key, name, negative=not matched)
+    return name
+
+def _resolve_station_name(text: str) -> Tuple[str, bool]:
+    all_station_names = get_all_police_station_names()
+    if not all_station_names:
+        # Not a verdict on the text; translate_to_english caches nothing
+        raise Exception("No police station names available")
+
+    local_match, shortlist = match_station_name(text, all_station_names)
+    if local_match:
+        logger.info(f"Resolved '{text}' locally to {local_match}")
+        return local_match, True
+
+    if not shortlist:
+        return text, False
+    if not openai_client:
+        logger.warning("OpenAI client not available, returning original text")
+        return text, False
+
+    response = openai_client.chat.completions.create(
+        model=GPT_MODEL,
+        messages=resolver_messages(text, shortlist),
+        response_format={"type": "json_object"}
+    )
+    return parse_resolution(response.choices[0].message.content, shortlist, text)
+
+def _load_police_station_names() -> List[str]:
     """
-    Get all police station names from both models with Redis caching
+    Station names from both models: the copy another process shared in Redis,
+    else a scan of both collections, which is then shared
     """
-    try:
-        # Try to get from Redis cache first if available
-        if redis_client is not None:
-            try:
-                cached_data = redis_client.get(POLICE_STATIONS_CACHE_KEY)
-                if cached_data:
-                    return json.loads(cached_data)
-            except redis.RedisError:
-                logger.warning("Redis cache unavailable")
-
-        if pi_users is None or sp_users is None:
-            raise Exception("Database connections not available")
-
-        # Get station names from both collections
-        sp_users_data = list(sp_users.find({}, {"stationName": 1}))
-        sp_station_names = [user.get("stationName") for user in sp_users_data if user.get("stationName")]
-
-        pi_users_data = list(pi_users.find({}, {"stationName": 1}))
-        pi_station_names = [user.get("stationName") for user in pi_users_data if user.get("stationName")]
-
-        # Combine and deduplicate station names
-        all_station_names = list(set(sp_station_names + pi_station_names))
-
-        # Store in Redis cache with TTL if available
-        if redis_client is not None:
-            try:
-                redis_client.setex(POLICE_STATIONS_CACHE_KEY, CACHE_TTL, json.dumps(all_station_names))
-            except redis.RedisError:
-                logger.warning("Failed to update Redis cache")
-
-        return all_station_names
+    if redis_client is not None and redis_breaker.allow():
+        try:
+            cached_data = redis_client.get(POLICE_STATIONS_CACHE_KEY)
+            redis_breaker.success()
+            if cached_data:
+                return json.loads(cached_data)
+        except redis.RedisError:
+            logger.warning("Redis cache unavailable")
+            redis_breaker.failure()
 
-    except Exception as e:
-        logger.error(f"Error fetching police station names: {e}")
-        
-        # Fallback: try to get from Redis even if there's an error with the database
-        if redis_client is not None:
-            try:
-                cached_data = redis_client.get(POLICE_STATIONS_CACHE_KEY)
-                if cached_data:
-                    return json.loads(cached_data)
-            except Exception as redis_error:
-                logger.error(f"Redis fallback also failed: {redis_error}")
+    if pi_users is None or sp_users is None:
+        raise Exception("Database connections not available")
 
-        return []
+    # Get station names from both collections
+    sp_users_data = list(sp_users.find({}, {"stationName": 1}))
+    sp_station_names = [user.get("stationName") for user in sp_users_data if user.get("stationName")]
 
-def correct_police_station_name_with_gpt(text: str) -> str:
-    """
-    Correct police station name using GPT and available station names
-    """
-    try:
-        if not openai_client:
-            return text
-
-        all_station_names = get_all_police_station_names()
-
-        if not all_station_names:
-            return text
-
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"""
-                    You are a police station name matching assistant.
-                    Given a user input and a list of valid police station names, your task is to return the most accurate match.
-
-                    Matching Rules:
-                    Return ONLY the corrected police station name if a confident and accurate match exists in the provided list.
-                    If no reliable match is found, return the original text.
-                    Do not include explanations, comments, or extra text.
-
-                    Consider:
-                    Spelling variations
-                    Abbreviations (PS, Thana, Chowki, etc.)
-                    Common typos
-                    Extra words like "city", "town", "near", etc.
-                    Prioritize exact or very close matches.
-                    reutrn output like ozer police station
-                    Available station names: {", ".join(all_station_names[:30])}
-                    """
-                },
-                {
-                    "role": "user",
-                    "content": f'User input to match: "{text}"'
-                }
-            ]
-        )
+    pi_users_data = list(pi_users.find({}, {"stationName": 1}))
+    pi_station_names = [user.get("stationName") for user in pi_users_data if user.get("stationName")]
 
-        corrected_name = response.choices[0].message.content.strip()
+    # Combine and deduplicate station names
+    all_station_names = list(set(sp_station_names + pi_station_names))
 
-        # Verify the corrected name is actually in our list
-        if corrected_name and corrected_name in all_station_names:
-            return corrected_name
+    # Store in Redis cache with TTL if available
+    if redis_client is not None and redis_breaker.allow():
+        try:
+            redis_client.setex(POLICE_STATIONS_CACHE_KEY, CACHE_TTL, json.dumps(all_station_names))
+            redis_breaker.success()
+        except redis.RedisError:
+            logger.warning("Failed to update Redis cache")
+            redis_breaker.failure()
 
-        return text
+    return all_station_names
 
-    except Exception as e:
-        logger.error(f"GPT police station matching error: {e}")
-        return text
+# Station names in-process: served stale while one refresh runs, and dropped
+# across processes through Redis pub/sub when a station is edited
+station_names = StationNamesCache(_load_police_station_names, redis_client, redis_breaker,
+                                  dependents=(translation_cache, location_cache))
 
-def correct_police_station_format(text: str) -> str:
+def get_all_police_station_names() -> List[str]:
     """
-    Correct police station format using GPT before matching
+    Get all police station names from both models, from an in-process copy
+    that is refreshed in the background once stale
     """
-    try:
-        if not openai_client:
-            return text
-
-        all_station_names = get_all_police_station_names()
-
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"""
-                    You are a police station name formatter. Extract and format police station names to match standard formats.
-
-                    Rules:
-                    - Remove extra words like "town:", "city:", "ps", "thana", "chowki".
-                    - Standardize to "Place Name Police Station".
-                    - Correct common spelling mistakes.
-                    - If multiple place names are present, keep only the valid police station name.
-                    - Only use location names if no station name is provided.
-                    - If it doesn't look like a police station name, return the original text.
-
-                    Available station formats: {", ".join(all_station_names[:20]) if all_station_names else "None available"}
-                    """
-                },
-                {
-                    "role": "user",
-                    "content": text
-                }
-            ]
-        )
-
-        corrected = response.choices[0].message.content.strip()
-        return corrected or text
+    return station_names.get()
 
-    except Exception as e:
-        logger.error(f"Police station format correction error: {e}")
-        return text
-
-def needs_translation(text: str) -> bool:
+def invalidate_station_names():
     """
-    Check if text needs translation
+    Call after editing a station: every process refreshes its names and
+    forgets the translations and lookups worked out from the old ones
     """
-    if not text:
-        return False
-        
-    # Check for non-English characters (Marathi/Hindi)
-    has_non_english = bool(re.search(r'[\u0900-\u097F]', text))
-
-    # Check for obvious spelling mistakes or abbreviations
-    has_common_mistakes = bool(re.search(r'(ps|thana|chowki|नाका|थाना)', text, re.IGNORECASE))
+    station_names.invalidate()
+    for cache in (translation_cache, location_cache):
+        cache.clear()
+    if redis_client is not None:
+        publish_invalidation(redis_client, POLICE_STATIONS_CACHE_KEY)
 
-    # Check if it's all uppercase (might need normalization)
-    is_all_uppercase = text == text.upper() and text != text.lower()
-
-    return has_non_english or has_common_mistakes or is_all_uppercase
-
-def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+def get_station_name_forms() -> Dict[str, str]:
     """
-    Calculate distance between two coordinates using Haversine formula
+    Map the Devanagari and romanized forms of every police station name to the stored name
     """
-    R = 6371  # Earth's radius in kilometers
-    d_lat = math.radians(lat2 - lat1)
-    d_lon = math.radians(lon2 - lon1)
-    
-    a = (math.sin(d_lat / 2) * math.sin(d_lat / 2) +
-         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
-         math.sin(d_lon / 2) * math.sin(d_lon / 2))
-    
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    distance = R * c * 1000  # Convert to meters
-    
-    return round(distance)
+    return station_name_forms(tuple(get_all_police_station_names()))
 
 # Example usage and test function
 def main():
+    warm_up()
     # Test with various inputs
     test_inputs = [
         "ozar Police Station",
@@ -0,0 +1,530 @@
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List, Tuple
+
+import redis
+import redis.asyncio as aioredis
+from motor.motor_asyncio import AsyncIOMotorClient
+from openai import AsyncOpenAI
+
+from .location_common import (
+    CACHE_TTL, GPT_MODEL, LOCATION_CACHE_NEGATIVE_TTL, LOCATION_CACHE_SIZE, LOCATION_CACHE_TTL,
+    MAPS_CACHE_NEGATIVE_TTL, MAPS_CACHE_TTL, MAPS_CACHEABLE_STATUSES, PLACES_DETAILS_URL,
+    PLACES_FIND_URL, PLACES_NEARBY_URL, POLICE_STATIONS_CACHE_KEY, LocationNotFound, LocationResult,
+    cache_key, clean_location_name, database_station, fallback_station, geohash,
+    google_station, location_response, match_station_name, outside_jurisdiction_response,
+    parse_resolution, policy_response, resolver_messages, station_location_result,
+    station_name_forms, valid_police_stations,
+)
+from .cache import MISSING, SingleFlight
+from .http_client import http_client
+from .normalize import exact_name_query
+from .station_index import (
+    GOOGLE_FALLBACK, MAX_DISTANCE, STATION_PROJECTION, STATIONS_WITH_COORDINATES,
+    StationIndex, nearest_station_result,
+)
+from .station_names import AsyncStationNamesCache, publish_invalidation_async
+from .tiered_cache import RedisBreaker, TieredCache
+from .transliterate import is_devanagari, to_latin
+
+# asyncio twin of location_search: the same functions as coroutines, so a
+# lookup in one call never holds up the event loop serving other calls
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+MONGO_URI = os.getenv("MONGO_URI")
+HTTP_TIMEOUT = float(os.getenv("LOCATION_HTTP_TIMEOUT", 10))
+
+# None of these connect until first used
+openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+
+redis_client = aioredis.Redis(
+    host=os.getenv("REDIS_HOST", "localhost"),
+    port=int(os.getenv("REDIS_PORT", 6379)),
+    password=os.getenv("REDIS_PASSWORD", ""),
+    decode_responses=True,
+    ssl=False,
+    socket_connect_timeout=5,
+    socket_timeout=5
+)
+
+mongo_client = AsyncIOMotorClient(MONGO_URI, serverSelectionTimeoutMS=5000, connect=False) if MONGO_URI else None
+db = mongo_client["rakshak-ai"] if mongo_client is not None else None
+pi_users = db["piusers"] if db is not None else None
+sp_users = db["spusers"] if db is not None else None
+
+# Every Redis user here goes local-only for a while once Redis stops answering
+redis_breaker = RedisBreaker()
+
+# Resolved names and whole lookups, so repeated place names cost no LLM or Maps call
+translation_cache = TieredCache("location:translation", redis_client, LOCATION_CACHE_SIZE,
+                                LOCATION_CACHE_TTL, LOCATION_CACHE_NEGATIVE_TTL, redis_breaker)
+location_cache = TieredCache("location:selection", redis_client, LOCATION_CACHE_SIZE,
+                             LOCATION_CACHE_TTL, LOCATION_CACHE_NEGATIVE_TTL, redis_breaker)
+# Places responses: text search by normalized query, nearby search by geohash
+# cell, details by place_id
+maps_caches = {
+    url: TieredCache(f"maps:{name}", redis_client, LOCATION_CACHE_SIZE, MAPS_CACHE_TTL, MAPS_CACHE_NEGATIVE_TTL,
+                     redis_breaker)
+    for name, url in (("find", PLACES_FIND_URL), ("nearby", PLACES_NEARBY_URL), ("details", PLACES_DETAILS_URL))
+}
+maps_flight = SingleFlight()
+
+# Police stations by coordinates, for nearest-station queries without Google
+station_index = StationIndex()
+station_index_lock = asyncio.Lock()
+
+async def _ping_redis() -> bool:
+    try:
+        await redis_client.ping()
+        logger.info("Redis connected successfully")
+        redis_breaker.success()
+        return True
+    except redis.RedisError as e:
+        logger.warning(f"Redis connection failed: {e}")
+        # Caches start local-only rather than each waiting on the connect
+        redis_breaker.failure()
+        return False
+
+async def _ping_mongo() -> bool:
+    if mongo_client is None:
+        return False
+    try:
+        await mongo_client.admin.command('ping')
+        logger.info("MongoDB connected successfully")
+        return True
+    except Exception as e:
+        logger.error(f"MongoDB connection failed: {e}")
+        return False
+
+async def check_connections() -> Dict[str, bool]:
+    """Ping Redis and MongoDB at the same time, logging which are reachable"""
+    redis_ok, mongo_ok = await asyncio.gather(_ping_redis(), _ping_mongo())
+    return {"redis": redis_ok, "mongo": mongo_ok}
+
+async def warm_up() -> Dict[str, bool]:
+    """
+    Connect to Redis and MongoDB and load the station names and station
+    index, so the first caller does not pay for it. Meant to be awaited once
+    at startup.
+    """
+    status = await check_connections()
+    if status["mongo"]:
+        await asyncio.gather(get_all_police_station_names(), refresh_station_index())
+    return status
+
+async def get_places_json(url: str, params: Dict[str, Any], key: str) -> Dict[str, Any]:
+    """
+    Places API response from the cache, or fetched once however many
+    callers ask for the same key at the same time
+    """
+    cache = maps_caches[url]
+    cached = await cache.aget(key)
+    if cached is not MISSING:
+        return cached
+    return await maps_flight.do(f"{url}|{key}", _fetch_places_json, cache, url, params, key)
+
+async def _fetch_places_json(cache: TieredCache, url: str, params: Dict[str, Any], key: str) -> Dict[str, Any]:
+    data = await http_client.get_json(url, params, timeout=HTTP_TIMEOUT)
+    if data.get('status') in MAPS_CACHEABLE_STATUSES:
+        await cache.aset(key, data, negative=data['status'] != 'OK')
+    return data
+
+async def location_selector(text_input: str, language: str = "english") -> Dict[str, Any]:
+    """
+    Main function to handle location selection based on text input
+    """
+    if text_input.strip() in ["0", "०"]:
+        return policy_response()
+
+    key = cache_key(text_input, language)
+    cached = await location_cache.aget(key)
+    if cached is not MISSING:
+        return cached
+
+    result, cacheable = await _select_location(text_input, language)
+    # Only a database hit or a place nobody knows is cached, the latter as
+    # negative so it expires sooner; answers reached through a failed
+    # lookup or Google Maps alone are worked out again next time
+    if cacheable:
+        await location_cache.aset(key, result, negative="data" not in result)
+    return result
+
+async def _select_location(text_input: str, language: str) -> Tuple[Dict[str, Any], bool]:
+    location_name = text_input
+    matched_station_name = None
+    db_missed = False
+
+    # Devanagari input is transliterated locally; an exact station name needs no GPT call
+    if is_devanagari(location_name):
+        name_forms = await get_station_name_forms()
+        location_name = to_latin(location_name.strip())
+        matched_station_name = (
+            name_forms.get(text_input.strip())
+            or name_forms.get(location_name.lower())
+        )
+
+    try:
+        # Translate and process the location name
+        if matched_station_name:
+            location_name = matched_station_name
+        else:
+            try:
+                location_name = await translate_to_english(location_name)
+                print("location_name "+location_name)
+            except Exception as e:
+                logger.error(f"Language processing failed, continuing with original: {e}")
+
+        # First try to find in our police station database
+        try:
+            location_details = await get_coordinates_from_location_name(location_name)
+            logger.info("Found location in database")
+            return location_response(location_name, location_details), True
+        except Exception as db_error:
+            logger.warning(f"Database search failed: {db_error}, trying Google Maps")
+            db_missed = isinstance(db_error, LocationNotFound)
+            # If database search fails, try Google Maps
+            location_details = await get_location_from_google_maps(location_name)
+
+            # After Google Maps search, try database again with the found location name
+            if location_details and location_details.display_name:
+                try:
+                    logger.info(f"Trying database search again with: {location_details.display_name}")
+                    db_location_details = await get_coordinates_from_location_name(location_details.display_name)
+                    # If found in database, use the database result which has complete info
+                    location_details = db_location_details
+                    logger.info("Successfully found in database after Google Maps search")
+                    return location_response(location_name, location_details), db_missed
+                except Exception as second_db_error:
+                    logger.warning(f"Second database search also failed: {second_db_error}, using Google Maps data")
+
+        return location_response(location_name, location_details), False
+
+    except Exception as e:
+        logger.error(f"Location processing error: {e}")
+        # Cached only when the database and Google Maps both answered that they do not know the place
+        return outside_jurisdiction_response(language), db_missed and isinstance(e, LocationNotFound)
+
+async def get_coordinates_from_location_name(location_name: str) -> LocationResult:
+    """
+    Get coordinates and police station info from location name using our database
+    """
+    try:
+        if pi_users is None:
+            raise Exception("MongoDB connection not available")
+
+        # Indexed exact match on the normalized name first, then stations containing the name
+        police_stations = await pi_users.find_one(exact_name_query("piusers", location_name))
+        if not police_stations:
+            police_stations = await pi_users.find_one({
+                "stationName": {"$regex": re.escape(location_name), "$options": "i"}
+            })
+
+        if not police_stations:
+            raise LocationNotFound("No police station found with the given name")
+
+        # Pick the first matching station
+        return station_location_result(police_stations)
+
+    except Exception as e:
+        logger.error(f"Database search error: {e}")
+        raise e
+
+async def get_location_from_google_maps(location_name: str) -> LocationResult:
+    """
+    Fallback to Google Maps API when database search fails
+    """
+    try:
+        if not GOOGLE_MAPS_API_KEY:
+            raise Exception("Google Maps API key not available")
+
+        # Use Google Places API to find the location
+        params = {
+            'input': location_name + " Nashik",
+            'inputtype': 'textquery',
+            'fields': 'name,geometry,formatted_address,types',
+            'key': GOOGLE_MAPS_API_KEY
+        }
+
+        data = await get_places_json(PLACES_FIND_URL, params, cache_key(location_name))
+
+        if data['status'] == 'ZERO_RESULTS' or (data['status'] == 'OK' and not data.get('candidates')):
+            raise LocationNotFound(f"Google Maps found no place: {data.get('status')}")
+        if data['status'] != 'OK':
+            raise Exception(f"Google Maps API error: {data.get('status')}")
+
+        candidate = data['candidates'][0]
+        geometry = candidate.get('geometry', {}).get('location', {})
+
+        if not geometry:
+            raise Exception("No coordinates found in Google Maps response")
+
+        lat = geometry.get('lat')
+        lng = geometry.get('lng')
+
+        if not lat or not lng:
+            raise Exception("Invalid coordinates from Google Maps")
+
+        # Extract the actual location name from Google Maps
+        google_location_name = candidate.get('name', location_name)
+
+        # Try to find this location in our database first
+        try:
+            logger.info(f"Searching database for Google Maps result: {google_location_name}")
+            db_result = await get_coordinates_from_location_name(google_location_name)
+            logger.info(f"Found in database after Google Maps: {db_result.display_name}")
+            return db_result
+        except Exception as db_error:
+            logger.warning(f"Google Maps location not found in database: {db_error}")
+            # If not in database, get police station info from Google Maps
+            police_station_details = await get_nearest_police_station_from_coords(lat, lng)
+
+            return LocationResult(
+                display_name=google_location_name,
+                lat=lat,
+                lon=lng,
+                nearest_police_station=police_station_details
+            )
+
+    except Exception as e:
+        logger.error(f"Google Maps search error: {e}")
+        raise e
+
+async def refresh_station_index():
+    """Reload the station index from MongoDB once it is stale, one caller at a time"""
+    if station_index.stale() and pi_users is not None:
+        async with station_index_lock:
+            if station_index.stale():
+                try:
+                    stations = await pi_users.find(STATIONS_WITH_COORDINATES, STATION_PROJECTION).to_list(length=None)
+                    station_index.build(stations)
+                    logger.info(f"Station index built with {len(station_index)} stations")
+                except Exception as e:
+                    logger.warning(f"Station index refresh failed, keeping {len(station_index)} stations: {e}")
+
+async def find_nearest_stations(latitude: float, longitude: float, k: int = 1) -> List[Dict[str, Any]]:
+    """
+    The k police stations nearest to a point from the local station index,
+    nearest first, each with its distance in meters
+    """
+    await refresh_station_index()
+    return [nearest_station_result(distance, station)
+            for distance, station in station_index.nearest(latitude, longitude, k)]
+
+async def get_nearest_police_station_from_coords(latitude: float, longitude: float) -> Dict[str, Any]:
+    """
+    Find nearest police station from our stations' coordinates, falling back
+    to Google Places API when none is close enough
+    """
+    nearest = await find_nearest_stations(latitude, longitude)
+    if nearest and nearest[0]["distance"] <= MAX_DISTANCE:
+        return nearest[0]
+    if not GOOGLE_FALLBACK:
+        return fallback_station(latitude, longitude, "Police Station",
+                                "No police station found nearby",
+                                "no_local_station")
+
+    try:
+        if not GOOGLE_MAPS_API_KEY:
+            return fallback_station(latitude, longitude, "Unknown Police Station",
+                                    "Location found but police station details unavailable",
+                                    "google_maps_fallback")
+
+        # Search for police stations nearby
+        params = {
+            'location': f'{latitude},{longitude}',
+            'radius': 10000,  # 10km radius
+            'keyword': 'police station',
+            'key': GOOGLE_MAPS_API_KEY
+        }
+
+        data = await get_places_json(PLACES_NEARBY_URL, params, geohash(latitude, longitude))
+
+        if data['status'] != 'OK' or not data.get('results'):
+            return fallback_station(latitude, longitude, "Nearest Police Station",
+                                    "Police station details not available",
+                                    "google_maps_no_station")
+
+        # Filter for actual police stations
+        police_stations = valid_police_stations(data['results'])
+
+        if not police_stations:
+            return fallback_station(latitude, longitude, "Police Station",
+                                    "No police station found nearby",
+                                    "google_maps_no_valid_station")
+
+        # Get the nearest one
+        nearest_station = police_stations[0]
+        station_location = nearest_station['geometry']['location']
+
+        # Get more details
+        details_params = {
+            'place_id': nearest_station['place_id'],
+            'fields': 'name,formatted_address,formatted_phone_number,website',
+            'key': GOOGLE_MAPS_API_KEY
+        }
+
+        details_data = await get_places_json(PLACES_DETAILS_URL, details_params, details_params['place_id'])
+
+        station_details = details_data.get('result', {}) if details_data.get('status') == 'OK' else {}
+
+        # Try to find this police station in our database
+        station_name = station_details.get('name', nearest_station.get('name', 'Police Station'))
+        try:
+            if pi_users is not None:
+                db_station = await pi_users.find_one({
+                    "$or": [
+                        exact_name_query("piusers", station_name),
+                        {"stationName": {"$regex": re.escape(station_name), "$options": "i"}},
+                        {"stationName": {"$regex": re.escape(clean_location_name(station_name)), "$options": "i"}}
+                    ]
+                })
+
+                if db_station:
+                    logger.info(f"Found police station in database: {db_station.get('stationName')}")
+                    return database_station(db_station, station_location)
+        except Exception as db_error:
+            logger.warning(f"Could not find police station in database: {db_error}")
+
+        return google_station(station_name, station_details, station_location)
+
+    except Exception as e:
+        logger.error(f"Error finding nearest police station: {e}")
+        return fallback_station(latitude, longitude, "Police Station",
+                                "Error retrieving police station details",
+                                "error")
+
+async def translate_to_english(text: str) -> str:
+    """
+    Resolve text to a police station name, or its English form if no station
+    matches. Results are cached; on a miss, local matching against the
+    cached station names is tried first, and only when it is not confident
+    does a single LLM call translate and pick the station together.
+    """
+    # Devanagari is romanized locally rather than by the translation model
+    text = to_latin(text)
+    key = cache_key(text)
+    cached = await translation_cache.aget(key)
+    if cached is not MISSING:
+        return cached
+
+    try:
+        name, matched = await _resolve_station_name(text)
+    except Exception as e:
+        logger.error(f"Translation error: {e}")
+        return text
+
+    # Names served stale after an invalidation would put the old answer back
+    if station_names.status() == "fresh":
+        await translation_cache.aset(key, name, negative=not matched)
+    return name
+
+async def _resolve_station_name(text: str) -> Tuple[str, bool]:
+    all_station_names = await get_all_police_station_names()
+    if not all_station_names:
+        # Not a verdict on the text; translate_to_english caches nothing
+        raise Exception("No police station names available")
+
+    local_match, shortlist = match_station_name(text, all_station_names)
+    if local_match:
+        logger.info(f"Resolved '{text}' locally to {local_match}")
+        return local_match, True
+
+    if not shortlist:
+        return text, False
+    if not openai_client:
+        logger.warning("OpenAI client not available, returning original text")
+        return text, False
+
+    response = await openai_client.chat.completions.create(
+        model=GPT_MODEL,
+        messages=resolver_messages(text, shortlist),
+        response_format={"type": "json_object"}
+    )
+    return parse_resolution(response.choices[0].message.content, shortlist, text)
+
+async def _load_police_station_names() -> List[str]:
+    """
+    Station names from both models: the copy another process shared in Redis,
+    else a scan of both collections, which is then shared
+    """
+    if redis_breaker.allow():
+        try:
+            cached_data = await redis_client.get(POLICE_STATIONS_CACHE_KEY)
+            redis_breaker.success()
+            if cached_data:
+                return json.loads(cached_data)
+        except redis.RedisError:
+            logger.warning("Redis cache unavailable")
+            redis_breaker.failure()
+
+    if pi_users is None or sp_users is None:
+        raise Exception("Database connections not available")
+
+    # Get station names from both collections at once
+    sp_users_data, pi_users_data = await asyncio.gather(
+        sp_users.find({}, {"stationName": 1}).to_list(length=None),
+        pi_users.find({}, {"stationName": 1}).to_list(length=None),
+    )
+    sp_station_names = [user.get("stationName") for user in sp_users_data if user.get("stationName")]
+    pi_station_names = [user.get("stationName") for user in pi_users_data if user.get("stationName")]
+
+    # Combine and deduplicate station names
+    all_station_names = list(set(sp_station_names + pi_station_names))
+
+    if redis_breaker.allow():
+        try:
+            await redis_client.setex(POLICE_STATIONS_CACHE_KEY, CACHE_TTL, json.dumps(all_station_names))
+            redis_breaker.success()
+        except redis.RedisError:
+            logger.warning("Failed to update Redis cache")
+            redis_breaker.failure()
+
+    return all_station_names
+
+# Station names in-process: served stale while one refresh runs, and dropped
+# across processes through Redis pub/sub when a station is edited
+station_names = AsyncStationNamesCache(_load_police_station_names, redis_client,
+                                       dependents=(translation_cache, location_cache))
+
+async def get_all_police_station_names() -> List[str]:
+    """
+    Get all police station names from both models, from an in-process copy
+    that is refreshed in the background once stale
+    """
+    return await station_names.get()
+
+async def invalidate_station_names():
+    """
+    Call after editing a station: every process refreshes its names and
+    forgets the translations and lookups worked out from the old ones
+    """
+    station_names.invalidate()
+    for cache in (translation_cache, location_cache):
+        await cache.aclear()
+    await publish_invalidation_async(redis_client, POLICE_STATIONS_CACHE_KEY)
+
+async def get_station_name_forms() -> Dict[str, str]:
+    """
+    Map the Devanagari and romanized forms of every police station name to the stored name
+    """
+    return station_name_forms(tuple(await get_all_police_station_names()))
+
+# Example usage and test function
+async def main():
+    await warm_up()
+    for test_input in ["ozar Police Station"]:
+        print(f"\nTesting: '{test_input}'")
+        try:
+            print(await location_selector(test_input, "english"))
+        except Exception as e:
+            print(f"✗ Exception: {e}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+import argparse
+import asyncio
+import logging
+import re
+
+from pymongo import UpdateOne
+
+from .transliterate import to_latin
+
+logger = logging.getLogger(__name__)
+
+# collection -> (name field, stored normalized field)
+NORMALIZED_FIELDS = {
+    "villages": ("villagename", "villagename_norm"),
+    "piusers": ("stationName", "stationName_norm"),
+    "spusers": ("stationName", "stationName_norm"),
+}
+
+
+def normalize_name(name):
+    """Key for exact name lookups: romanized, lowercase and single-spaced"""
+    return " ".join(to_latin(name or "").lower().split())
+
+
+def exact_name_query(collection_name, name):
+    """
+    Filter for documents named name: an equality on the stored normalized
+    field, or, for documents written without that field since the last
+    backfill, an anchored case-insensitive match on the name itself
+    """
+    name_field, norm_field = NORMALIZED_FIELDS[collection_name]
+    pattern = r"^\s*" + r"\s+".join(re.escape(word) for word in name.split()) + r"\s*$"
+    return {"$or": [
+        {norm_field: normalize_name(name)},
+        {norm_field: {"$exists": False}, name_field: {"$regex": pattern, "$options": "i"}},
+    ]}
+
+
+async def ensure_name_indexes(db):
+    """
+    Secondary indexes on the normalized fields. Not unique: the same village
+    name occurs under different stations.
+    """
+    for collection_name, (_, norm_field) in NORMALIZED_FIELDS.items():
+        await db[collection_name].create_index(norm_field)
+
+
+async def backfill_normalized_names(db, recompute=False, batch_size=500):
+    """Populate the normalized fields; by default only documents missing them"""
+    counts = {}
+    for collection_name, (name_field, norm_field) in NORMALIZED_FIELDS.items():
+        collection = db[collection_name]
+        query = {} if recompute else {norm_field: {"$exists": False}}
+        updated = 0
+        batch = []
+        async for doc in collection.find(query, {name_field: 1}):
+            batch.append(UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {norm_field: normalize_name(doc.get(name_field))}},
+            ))
+            if len(batch) >= batch_size:
+                updated += (await collection.bulk_write(batch, ordered=False)).modified_count
+                batch = []
+        if batch:
+            updated += (await collection.bulk_write(batch, ordered=False)).modified_count
+        counts[collection_name] = updated
+        logger.info(f"Backfilled {norm_field} on {updated} {collection_name} documents")
+    return counts
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Backfill normalized name fields and their indexes")
+    parser.add_argument("--all", action="store_true", help="recompute the field on every document")
+    args = parser.parse_args()
+
+    from .location import db
+
+    await ensure_name_indexes(db)
+    print(await backfill_normalized_names(db, recompute=args.all))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,35 @@
+import re
+
+# Place-name endings that are written (and transcribed) inconsistently;
+# spelled as they look after phonetic_form has folded them
+SUFFIXES = ("vadi", "nagar", "gaon", "pada")
+MIN_STEM = 3
+
+
+def phonetic_form(name):
+    """
+    Fold spelling variants of a romanized Marathi/Hindi name into one form:
+    case, spacing and punctuation, w/v, z/j (झ is written both ways),
+    aspirated consonants, doubled vowels (aa/a, gaoon/gaon), gav/gaon and
+    the dev/deo/deva prefix.
+    """
+    text = re.sub(r"[^a-z]", "", (name or "").lower())
+    text = text.replace("w", "v").replace("z", "j")
+    text = re.sub(r"([bcdgjkpt])h", r"\1", text)
+    text = re.sub(r"([aeiou])\1+", r"\1", text)
+    text = re.sub(r"gav(?![aeiou])", "gaon", text)
+    text = re.sub(r"de(?:va|o)(?![aeiou])", "dev", text)
+    return text
+
+
+def strip_suffix(form):
+    """Drop one common place-name suffix, keeping at least MIN_STEM letters"""
+    for suffix in SUFFIXES:
+        if form.endswith(suffix) and len(form) - len(suffix) >= MIN_STEM:
+            return form[:-len(suffix)]
+    return form
+
+
+def phonetic_key(name):
+    """Bucket key shared by phonetic variants of a name"""
+    return strip_suffix(phonetic_form(name))
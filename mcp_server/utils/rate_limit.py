@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Allows rate acquisitions per second on average and up to burst at once.
+    Waiters are served in arrival order, so a burst is spread out instead of
+    being sent together and rejected together.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.acquired = 0
+        self.waits = 0
+        self.waited_secs = 0.0
+
+    def _refill(self):
+        current = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (current - self.updated) * self.rate)
+        self.updated = current
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                delay = (1 - self.tokens) / self.rate
+                self.waits += 1
+                self.waited_secs += delay
+                await asyncio.sleep(delay)
+                self._refill()
+            self.tokens -= 1
+            self.acquired += 1
+
+    def stats(self):
+        return {
+            "rate": self.rate,
+            "burst": self.capacity,
+            "acquired": self.acquired,
+            "waits": self.waits,
+            "waited_secs": round(self.waited_secs, 3),
+        }
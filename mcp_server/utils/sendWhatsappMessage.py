@@ -4,6 +4,8 @@ import os
 from typing import Union, Dict, Any
 from dotenv import load_dotenv
 
+from .http_client import http_client
+
 load_dotenv(dotenv_path="/home/ubuntu/testing/mcp_server/.env")
 
 FACEBOOK_BASE_URL = os.getenv("FACEBOOK_BASE_URL")
@@ -42,7 +44,7 @@ async def send_whatsapp_message(
     is_template: str = "custom"
 ) -> bool:
     """
-    Send WhatsApp message using Facebook Graph API with aiohttp
+    Send WhatsApp message using Facebook Graph API over the shared HTTP client
     """
     payload = {
         "messaging_product": "whatsapp",
@@ -64,26 +66,29 @@ async def send_whatsapp_message(
         payload["text"] = {"body": formatted_message}
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{FACEBOOK_BASE_URL}/{os.getenv('WHATSAPP_PHONE_ID')}/messages",
-                json=payload,
-                headers={
-                    "Authorization": f"Bearer {os.getenv('WHATSAPP_ACCESS_TOKEN')}",
-                    "Content-Type": "application/json",
-                },
-                timeout=aiohttp.ClientTimeout(total=30)
-            ) as response:
-                print(response)
-                return response.status == 200
-                
-    except aiohttp.ClientError as e:
+        status, body = await http_client.request(
+            "POST",
+            f"{FACEBOOK_BASE_URL}/{os.getenv('WHATSAPP_PHONE_ID')}/messages",
+            endpoint="whatsapp:messages",
+            json=payload,
+            headers={
+                "Authorization": f"Bearer {os.getenv('WHATSAPP_ACCESS_TOKEN')}",
+                "Content-Type": "application/json",
+            },
+            timeout=30
+        )
+        print(status, body)
+        return status == 200
+
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         print(f"WhatsApp API error: {e}")
         return False
     except Exception as e:
         print(f"Unexpected error: {e}")
         return False
 
+# Sends a test alert. The relative import above needs the package, so run it
+# as a module from mcp_server/: python -m utils.sendWhatsappMessage
 async def main():
     template_message = {
         "name": "alert_message_to_officer",
@@ -110,6 +115,7 @@ async def main():
     )
     
     print(out)
+    await http_client.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
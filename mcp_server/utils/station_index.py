@@ -0,0 +1,103 @@
+import math
+import os
+import time
+from typing import Any, Dict, List, Tuple
+
+from .location_common import calculate_distance, station_location_result
+
+# Grid cell size in degrees; 0.1 is about 11 km north-south
+CELL_DEGREES = float(os.getenv("STATION_GRID_CELL_DEGREES", 0.1))
+# Stations are re-read from MongoDB this often
+REFRESH_INTERVAL = int(os.getenv("STATION_INDEX_REFRESH_SECS", 10 * 60))
+# A local nearest station further than this is not trusted; Google is asked instead
+MAX_DISTANCE = float(os.getenv("NEAREST_STATION_MAX_METERS", 30000))
+GOOGLE_FALLBACK = os.getenv("NEAREST_STATION_GOOGLE_FALLBACK", "true").lower() == "true"
+
+# Fields the nearest-station result is built from
+STATION_PROJECTION = {
+    "email": 1, "fullName": 1, "stationName": 1, "address": 1,
+    "mobNumber": 1, "stationMobNumber": 1, "location": 1,
+}
+STATIONS_WITH_COORDINATES = {"location.coordinates.1": {"$exists": True}}
+
+
+def station_point(station: Dict[str, Any]):
+    """(lat, lon) of a piusers document, or None; coordinates are stored GeoJSON style as [lon, lat]"""
+    coordinates = (station.get("location") or {}).get("coordinates") or []
+    if len(coordinates) < 2:
+        return None
+    try:
+        return float(coordinates[1]), float(coordinates[0])
+    except (TypeError, ValueError):
+        return None
+
+
+class StationIndex:
+    """
+    Uniform lat/lon grid over police stations. A k-nearest query scans rings
+    of cells outwards from the query point and stops once no unscanned cell
+    can hold a closer station than the k found so far.
+    """
+
+    def __init__(self, cell_degrees=CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.loaded_at = None
+        self._cells = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def stale(self, max_age=REFRESH_INTERVAL):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > max_age
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_degrees)), int(math.floor(lon / self.cell_degrees))
+
+    def build(self, stations):
+        """Replace the indexed stations; those without usable coordinates are skipped"""
+        cells = {}
+        count = 0
+        for station in stations:
+            point = station_point(station)
+            if point is None:
+                continue
+            cells.setdefault(self._cell(*point), []).append((point[0], point[1], station))
+            count += 1
+        self._cells = cells
+        self._count = count
+        self.loaded_at = time.monotonic()
+
+    def nearest(self, lat: float, lon: float, k: int = 1) -> List[Tuple[int, Dict[str, Any]]]:
+        """Up to k (distance in meters, station) pairs, nearest first"""
+        cells = self._cells
+        if not cells:
+            return []
+        row, col = self._cell(lat, lon)
+        # A degree of latitude is ~111 km everywhere; a degree of longitude
+        # shrinks with latitude, so rings are bounded by the latitude width
+        ring_meters = self.cell_degrees * 111_000 * max(math.cos(math.radians(lat)), 0.01)
+        max_ring = max(max(abs(r - row), abs(c - col)) for r, c in cells)
+
+        found = []
+        for ring in range(max_ring + 1):
+            for r in range(row - ring, row + ring + 1):
+                for c in range(col - ring, col + ring + 1):
+                    if max(abs(r - row), abs(c - col)) != ring:
+                        continue
+                    for station_lat, station_lon, station in cells.get((r, c), ()):
+                        found.append((calculate_distance(lat, lon, station_lat, station_lon), station))
+            if len(found) >= k:
+                found.sort(key=lambda item: item[0])
+                # Anything in ring + 1 or beyond is at least ring * ring_meters away
+                if found[k - 1][0] <= ring * ring_meters:
+                    break
+        found.sort(key=lambda item: item[0])
+        return found[:k]
+
+
+def nearest_station_result(distance: int, station: Dict[str, Any]) -> Dict[str, Any]:
+    """nearest_police_station payload for an indexed station, with its distance in meters"""
+    result = station_location_result(station).nearest_police_station
+    result["distance"] = distance
+    return result
@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import redis
+
+from .tiered_cache import RedisBreaker
+
+logger = logging.getLogger(__name__)
+
+# Names younger than this are served as they are
+FRESH_FOR = int(os.getenv("STATION_NAMES_FRESH_SECS", 5 * 60))
+# Older names are still served, while one refresh runs in the background,
+# until they reach this age; after that callers wait for the refresh
+SERVE_STALE_FOR = int(os.getenv("STATION_NAMES_STALE_SECS", 60 * 60))
+# Published by whatever edits a station, so every process refreshes at once.
+# The message is the edited station's _id, or anything else when it is not one station
+INVALIDATION_CHANNEL = os.getenv("STATION_NAMES_CHANNEL", "police_station_names:invalidate")
+
+
+class StationNamesState:
+    """
+    Copy of the station names with its age, shared by the blocking and
+    asyncio caches. dependents are caches of results worked out from the
+    names; their in-process copies are dropped on every invalidation.
+    """
+
+    def __init__(self, fresh_for=FRESH_FOR, serve_stale_for=SERVE_STALE_FOR, dependents=()):
+        self.fresh_for = fresh_for
+        self.serve_stale_for = serve_stale_for
+        self.dependents = dependents
+        self.names = None
+        self.loaded_at = None
+        self.fresh_hits = 0
+        self.stale_hits = 0
+        self.waits = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.invalidations = 0
+
+    def age(self):
+        return None if self.loaded_at is None else time.monotonic() - self.loaded_at
+
+    def status(self):
+        """fresh, stale (servable while refreshing) or missing (callers must wait)"""
+        age = self.age()
+        if self.names is None or age is None or age > self.serve_stale_for:
+            return "missing"
+        return "fresh" if age <= self.fresh_for else "stale"
+
+    def store(self, names):
+        self.names = names
+        self.loaded_at = time.monotonic()
+        self.refreshes += 1
+
+    def invalidate(self):
+        """Make the copy stale but still servable, so the next caller triggers a refresh"""
+        self.invalidations += 1
+        if self.loaded_at is not None:
+            self.loaded_at = min(self.loaded_at, time.monotonic() - self.fresh_for - 1)
+        for cache in self.dependents:
+            cache.invalidate()
+
+    def stats(self):
+        return {
+            "size": len(self.names or ()),
+            "age": self.age(),
+            "fresh_hits": self.fresh_hits,
+            "stale_hits": self.stale_hits,
+            "waits": self.waits,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "invalidations": self.invalidations,
+        }
+
+
+class StationNamesCache(StationNamesState):
+    """
+    In-process station names for blocking callers. Stale names are served
+    while one background thread refreshes them; when there is nothing
+    servable, concurrent callers wait on that same refresh. The
+    invalidation subscription is made in the background too, through the
+    breaker shared with the other Redis users, and made again after Redis
+    comes back.
+    """
+
+    def __init__(self, load, redis_client=None, breaker=None, **kwargs):
+        super().__init__(**kwargs)
+        self._load = load
+        self._redis_client = redis_client
+        self._breaker = breaker or RedisBreaker()
+        self._lock = threading.Lock()
+        self._refreshing = None
+        self._listener = None
+
+    def get(self):
+        self._listen()
+        status = self.status()
+        if status == "fresh":
+            self.fresh_hits += 1
+            return self.names
+        refresh = self._start_refresh()
+        if status == "stale":
+            self.stale_hits += 1
+            return self.names
+        self.waits += 1
+        refresh.join()
+        return self.names or []
+
+    def _start_refresh(self):
+        with self._lock:
+            if self._refreshing is None or not self._refreshing.is_alive():
+                self._refreshing = threading.Thread(target=self._refresh, name="station-names-refresh", daemon=True)
+                self._refreshing.start()
+            return self._refreshing
+
+    def _refresh(self):
+        try:
+            self.store(self._load())
+        except Exception as e:
+            self.refresh_failures += 1
+            logger.error(f"Error fetching police station names: {e}")
+
+    def _listening(self):
+        return self._listener is not None and self._listener.is_alive()
+
+    def _listen(self):
+        if self._redis_client is None or self._listening():
+            return
+        with self._lock:
+            if self._listening() or not self._breaker.allow():
+                return
+            self._listener = threading.Thread(target=self._subscribe, name="station-names-subscribe", daemon=True)
+            self._listener.start()
+
+    def _subscribe(self):
+        try:
+            pubsub = self._redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{INVALIDATION_CHANNEL: lambda message: self.invalidate()})
+            self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True,
+                                                  exception_handler=self._listener_failed)
+            self._breaker.success()
+        except redis.RedisError as e:
+            # Expiry alone until a later call finds Redis back
+            self._breaker.failure()
+            logger.warning(f"Station name invalidations unavailable: {e}")
+
+    def _listener_failed(self, error, pubsub, thread):
+        logger.warning(f"Station name invalidations interrupted: {error}")
+        self._breaker.failure()
+        thread.stop()
+        pubsub.close()
+        # Resubscribe on a call once the breaker lets Redis be tried again
+        self._listener = None
+
+
+def publish_invalidation(redis_client, cache_key):
+    """Drop the shared copy in Redis and tell every process to refresh"""
+    redis_client.delete(cache_key)
+    redis_client.publish(INVALIDATION_CHANNEL, cache_key)
+
+
+async def publish_invalidation_async(redis_client, cache_key):
+    await redis_client.delete(cache_key)
+    await redis_client.publish(INVALIDATION_CHANNEL, cache_key)
+
+
+async def listen_for_invalidations(redis_client, handle, retry_secs=30):
+    """Call handle with every invalidation message, resubscribing after Redis errors, until cancelled"""
+    while True:
+        pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    handle(message.get("data"))
+        except (redis.RedisError, OSError) as e:
+            logger.warning(f"Station invalidations interrupted: {e}")
+        finally:
+            await pubsub.reset()
+        await asyncio.sleep(retry_secs)
+
+
+class AsyncStationNamesCache(StationNamesState):
+    """StationNamesCache for the event loop: the refresh is one shared task"""
+
+    def __init__(self, load, redis_client=None, **kwargs):
+        super().__init__(**kwargs)
+        self._load = load
+        self._redis_client = redis_client
+        self._refreshing = None
+        self._listener = None
+
+    async def get(self):
+        self._listen()
+        status = self.status()
+        if status == "fresh":
+            self.fresh_hits += 1
+            return self.names
+        refresh = self._start_refresh()
+        if status == "stale":
+            self.stale_hits += 1
+            return self.names
+        self.waits += 1
+        await asyncio.shield(refresh)
+        return self.names or []
+
+    def _start_refresh(self):
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.ensure_future(self._refresh())
+        return self._refreshing
+
+    async def _refresh(self):
+        try:
+            self.store(await self._load())
+        except Exception as e:
+            self.refresh_failures += 1
+            logger.error(f"Error fetching police station names: {e}")
+
+    def _listen(self):
+        if self._listener is None and self._redis_client is not None:
+            self._listener = asyncio.ensure_future(
+                listen_for_invalidations(self._redis_client, lambda data: self.invalidate()))
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
@@ -0,0 +1,199 @@
+import json
+import logging
+import os
+import time
+
+import redis
+
+from .cache import MISSING, TTLCache
+
+logger = logging.getLogger(__name__)
+
+# After a failed Redis call, caches stay local-only this long before trying again
+REDIS_RETRY_SECS = float(os.getenv("REDIS_RETRY_SECS", 30))
+
+
+class RedisBreaker:
+    """
+    Shared by everything using one Redis server: once a call fails, Redis is
+    skipped for retry_after seconds, so an outage costs one connect timeout
+    rather than one per lookup. Then a single call is let through to probe;
+    the others stay local-only until it succeeds.
+    """
+
+    def __init__(self, retry_after=REDIS_RETRY_SECS):
+        self.retry_after = retry_after
+        self.open_until = 0
+        self.trips = 0
+
+    @property
+    def closed(self):
+        return not self.open_until
+
+    def allow(self):
+        current = time.monotonic()
+        if current < self.open_until:
+            return False
+        if self.open_until:
+            # This caller probes; hold the rest back until it is answered
+            self.open_until = current + self.retry_after
+        return True
+
+    def success(self):
+        if self.open_until:
+            logger.info("Redis reachable again")
+        self.open_until = 0
+
+    def failure(self):
+        if not self.open_until:
+            logger.warning(f"Redis unavailable, caching locally for {self.retry_after:.0f}s")
+        self.open_until = time.monotonic() + self.retry_after
+        self.trips += 1
+
+
+
+class TieredCache:
+    """
+    TTLCache in front of Redis, so results are shared between processes and
+    survive restarts. Values must be JSON serializable; both tiers hold the
+    serialized form, so callers always get a fresh copy. A result stored as
+    negative ("not found") is kept for negative_ttl only. Redis errors count
+    as misses, and with a breaker Redis is skipped for a while after one.
+    get/set take a blocking redis client, aget/aset an asyncio one.
+    """
+
+    def __init__(self, namespace, redis_client=None, maxsize=1024, ttl=3600, negative_ttl=300, breaker=None):
+        self.namespace = namespace
+        self.redis_client = redis_client
+        self.breaker = breaker
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def _use_redis(self):
+        return self.redis_client is not None and (self.breaker is None or self.breaker.allow())
+
+    def _redis_ok(self):
+        if self.breaker is not None:
+            self.breaker.success()
+
+    def _redis_failed(self, action, error):
+        logger.warning(f"Redis cache {action} failed: {error}")
+        if self.breaker is not None:
+            self.breaker.failure()
+
+    def _redis_key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def _encode(self, value, negative):
+        return json.dumps({"value": value, "negative": negative}), self.negative_ttl if negative else self.ttl
+
+    def _decode(self, data):
+        item = json.loads(data)
+        if item["negative"]:
+            self.negative_hits += 1
+        return item["value"]
+
+    def _local_get(self, key):
+        data = self.local.get(key)
+        if data is not MISSING:
+            self.local_hits += 1
+        return data
+
+    def _remote_hit(self, key, data):
+        self.redis_hits += 1
+        # Redis does not say how long is left; hold the copy for the shorter TTL
+        self.local.set(key, data, ttl=min(self.ttl, self.negative_ttl))
+        return self._decode(data)
+
+    def get(self, key):
+        data = self._local_get(key)
+        if data is not MISSING:
+            return self._decode(data)
+        if self._use_redis():
+            try:
+                data = self.redis_client.get(self._redis_key(key))
+                self._redis_ok()
+            except redis.RedisError as e:
+                self._redis_failed("read", e)
+                data = None
+            if data is not None:
+                return self._remote_hit(key, data)
+        self.misses += 1
+        return MISSING
+
+    def set(self, key, value, negative=False):
+        data, ttl = self._encode(value, negative)
+        self.local.set(key, data, ttl=ttl)
+        if self._use_redis():
+            try:
+                self.redis_client.setex(self._redis_key(key), ttl, data)
+                self._redis_ok()
+            except redis.RedisError as e:
+                self._redis_failed("write", e)
+
+    async def aget(self, key):
+        data = self._local_get(key)
+        if data is not MISSING:
+            return self._decode(data)
+        if self._use_redis():
+            try:
+                data = await self.redis_client.get(self._redis_key(key))
+                self._redis_ok()
+            except redis.RedisError as e:
+                self._redis_failed("read", e)
+                data = None
+            if data is not None:
+                return self._remote_hit(key, data)
+        self.misses += 1
+        return MISSING
+
+    async def aset(self, key, value, negative=False):
+        data, ttl = self._encode(value, negative)
+        self.local.set(key, data, ttl=ttl)
+        if self._use_redis():
+            try:
+                await self.redis_client.setex(self._redis_key(key), ttl, data)
+                self._redis_ok()
+            except redis.RedisError as e:
+                self._redis_failed("write", e)
+
+    def invalidate(self, key=None):
+        """Drop one key, or every key, from this process; Redis copies expire on their own"""
+        self.local.invalidate(key)
+
+    def clear(self):
+        """Drop every key from this process and from Redis"""
+        self.local.invalidate()
+        if self._use_redis():
+            try:
+                keys = list(self.redis_client.scan_iter(match=self._redis_key("*"), count=500))
+                for start in range(0, len(keys), 500):
+                    self.redis_client.delete(*keys[start:start + 500])
+                self._redis_ok()
+            except redis.RedisError as e:
+                self._redis_failed("clear", e)
+
+    async def aclear(self):
+        self.local.invalidate()
+        if self._use_redis():
+            try:
+                keys = [key async for key in self.redis_client.scan_iter(match=self._redis_key("*"), count=500)]
+                for start in range(0, len(keys), 500):
+                    await self.redis_client.delete(*keys[start:start + 500])
+                self._redis_ok()
+            except redis.RedisError as e:
+                self._redis_failed("clear", e)
+
+    def stats(self):
+        return {
+            "size": len(self.local),
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,165 @@
+import re
+
+# Deterministic Devanagari <-> Latin transliteration for place names.
+# Romanization follows the plain ASCII spelling used for names in Maharashtra
+# (Nashik, Niphad, Devgaon) rather than a scholarly scheme: vowel length is
+# dropped and the inherent "a" is deleted where Marathi/Hindi speakers drop it.
+
+DEVANAGARI_RE = re.compile(r"[ऀ-ॿ]")
+
+VOWELS = {
+    "अ": "a", "आ": "a", "इ": "i", "ई": "i", "उ": "u", "ऊ": "u", "ऋ": "ru",
+    "ए": "e", "ऐ": "ai", "ओ": "o", "औ": "au", "ऑ": "o", "ॲ": "a", "ऍ": "e",
+}
+
+MATRAS = {
+    "ा": "a", "ि": "i", "ी": "i", "ु": "u", "ू": "u", "ृ": "ru",
+    "े": "e", "ै": "ai", "ो": "o", "ौ": "au", "ॉ": "o", "ॅ": "e",
+}
+
+CONSONANTS = {
+    "क": "k", "ख": "kh", "ग": "g", "घ": "gh", "ङ": "n",
+    "च": "ch", "छ": "chh", "ज": "j", "झ": "jh", "ञ": "ny",
+    "ट": "t", "ठ": "th", "ड": "d", "ढ": "dh", "ण": "n",
+    "त": "t", "थ": "th", "द": "d", "ध": "dh", "न": "n",
+    "प": "p", "फ": "ph", "ब": "b", "भ": "bh", "म": "m",
+    "य": "y", "र": "r", "ल": "l", "ळ": "l", "व": "v",
+    "श": "sh", "ष": "sh", "स": "s", "ह": "h",
+    "क़": "q", "ख़": "kh", "ग़": "g", "ज़": "z", "ड़": "d", "ढ़": "dh", "फ़": "f", "य़": "y",
+}
+
+# Consonant + nukta written as two code points
+NUKTA_FORMS = {"क": "q", "ज": "z", "फ": "f", "ड": "d", "ढ": "dh"}
+
+VIRAMA = "्"
+NUKTA = "़"
+NASALS = {"ं", "ँ"}
+VISARGA = "ः"
+# Digits and danda, translated before words are romanized
+PUNCTUATION = str.maketrans({**{chr(0x0966 + i): str(i) for i in range(10)}, "।": ".", "॥": "."})
+
+# Words that should be translated rather than spelled out
+WORDS = {
+    "पोलीस": "police", "पोलिस": "police", "पुलिस": "police", "पुलीस": "police",
+    "स्टेशन": "station", "ठाणे": "station", "ठाणा": "station", "थाना": "station",
+    "चौकी": "chowki", "गाव": "gaon", "गांव": "gaon", "गाँव": "gaon",
+}
+
+LATIN_CONSONANTS = {
+    "chh": "छ", "kh": "ख", "gh": "घ", "ch": "च", "jh": "झ", "th": "थ",
+    "dh": "ध", "ph": "फ", "bh": "भ", "sh": "श", "k": "क", "g": "ग",
+    "c": "क", "j": "ज", "z": "झ", "t": "त", "d": "द", "n": "न", "p": "प",
+    "b": "ब", "m": "म", "y": "य", "r": "र", "l": "ल", "v": "व", "w": "व",
+    "s": "स", "h": "ह", "f": "फ", "q": "क", "x": "क्स",
+}
+
+LATIN_VOWELS = {
+    "aa": ("आ", "ा"), "ai": ("ऐ", "ै"), "au": ("औ", "ौ"), "ee": ("ई", "ी"),
+    "ii": ("ई", "ी"), "oo": ("ऊ", "ू"), "uu": ("ऊ", "ू"), "a": ("अ", ""),
+    "i": ("इ", "ि"), "u": ("उ", "ु"), "e": ("ए", "े"), "o": ("ओ", "ो"),
+}
+
+LATIN_WORDS = {"police": "पोलीस", "station": "स्टेशन", "chowki": "चौकी", "ps": "पोलीस स्टेशन"}
+
+LATIN_TOKEN_RE = re.compile(
+    "|".join(sorted(list(LATIN_CONSONANTS) + list(LATIN_VOWELS), key=len, reverse=True))
+)
+
+
+def is_devanagari(text):
+    """True if the text contains any Devanagari characters"""
+    return bool(DEVANAGARI_RE.search(text or ""))
+
+
+def _romanize_word(word):
+    if word in WORDS:
+        return WORDS[word]
+
+    # Tokens: [kind, latin, inherent]; kind is "C" consonant, "V" vowel, "O" other
+    tokens = []
+    for ch in word:
+        if ch == "ञ" and tokens and tokens[-1][2] == "ज":
+            # ज्ञ is pronounced and spelled "dny" in Marathi
+            tokens[-1][1] = "dny"
+            tokens.append(["V", "a", True])
+        elif ch in CONSONANTS:
+            tokens.append(["C", CONSONANTS[ch], ch])
+            tokens.append(["V", "a", True])
+        elif ch in MATRAS and tokens and tokens[-1][0] == "V" and tokens[-1][2] is True:
+            tokens[-1] = ["V", MATRAS[ch], False]
+        elif ch == VIRAMA and tokens and tokens[-1][2] is True:
+            tokens.pop()
+        elif ch == NUKTA:
+            for token in reversed(tokens):
+                if token[0] == "C":
+                    token[1] = NUKTA_FORMS.get(token[2], token[1])
+                    break
+        elif ch in VOWELS:
+            tokens.append(["V", VOWELS[ch], False])
+        elif ch in NASALS:
+            tokens.append(["N", "n", None])
+        elif ch == VISARGA:
+            tokens.append(["O", "h", None])
+        else:
+            tokens.append(["O", ch if ch.isascii() else "", None])
+
+    # Word-final inherent "a" is silent unless it is the only vowel
+    vowels = [token for token in tokens if token[0] == "V"]
+    if len(vowels) > 1 and tokens[-1][0] == "V" and tokens[-1][2] is True:
+        tokens.pop()
+
+    # Medial schwa deletion, right to left: V C a C V -> V C C V, where a
+    # nasalized vowel counts as the leading V
+    i = len(tokens) - 3
+    while i >= 2:
+        token = tokens[i]
+        if (token[0] == "V" and token[2] is True
+                and tokens[i - 1][0] == "C" and tokens[i - 2][0] in ("V", "N")
+                and tokens[i + 1][0] == "C" and i + 2 < len(tokens) and tokens[i + 2][0] == "V"):
+            del tokens[i]
+        i -= 1
+
+    out = []
+    for i, token in enumerate(tokens):
+        if token[0] == "N":
+            following = tokens[i + 1][1] if i + 1 < len(tokens) else ""
+            out.append("m" if following[:1] in ("p", "b", "m") else "n")
+        else:
+            out.append(token[1])
+    return "".join(out)
+
+
+def to_latin(text):
+    """Romanize the Devanagari words in text; Latin text passes through unchanged"""
+    if not is_devanagari(text):
+        return text
+    text = text.translate(PUNCTUATION)
+    return re.sub(r"[ऀ-ॿ]+", lambda m: _romanize_word(m.group(0)), text)
+
+
+def _devanagari_word(word):
+    lower = word.lower()
+    if lower in LATIN_WORDS:
+        return LATIN_WORDS[lower]
+
+    tokens = LATIN_TOKEN_RE.findall(lower)
+    out = []
+    previous_consonant = False
+    for token in tokens:
+        if token in LATIN_CONSONANTS:
+            if previous_consonant:
+                out.append(VIRAMA)
+            out.append(LATIN_CONSONANTS[token])
+            previous_consonant = True
+        else:
+            independent, matra = LATIN_VOWELS[token]
+            out.append(matra if previous_consonant else independent)
+            previous_consonant = False
+    return "".join(out)
+
+
+def to_devanagari(text):
+    """Approximate Devanagari spelling of a romanized name; Devanagari passes through"""
+    if is_devanagari(text):
+        return text
+    return re.sub(r"[A-Za-z]+", lambda m: _devanagari_word(m.group(0)), text or "")
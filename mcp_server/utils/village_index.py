@@ -0,0 +1,413 @@
+import asyncio
+import heapq
+import logging
+import os
+from collections import namedtuple
+from operator import itemgetter
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from .phonetic import phonetic_form, strip_suffix
+from .transliterate import to_devanagari, to_latin
+from .village_snapshot import SNAPSHOT_PATH, read_snapshot, write_snapshot
+from .village_stations import NEAREST_STATION_FIELD
+
+logger = logging.getLogger(__name__)
+
+# Field the admin app bumps whenever a village is written; used for delta polling
+UPDATED_FIELD = os.getenv("VILLAGE_UPDATED_FIELD", "updated_at")
+REFRESH_INTERVAL = int(os.getenv("VILLAGE_INDEX_REFRESH_SECS", 60))
+# Every Nth poll also diffs the _id set, which catches deletes and
+# documents written without the updated field
+RECONCILE_EVERY = int(os.getenv("VILLAGE_INDEX_RECONCILE_EVERY", 10))
+# Change events applied together when they arrive faster than one at a time
+WATCH_BATCH = int(os.getenv("VILLAGE_INDEX_WATCH_BATCH", 500))
+# How many villages survive the n-gram prefilter and reach the exact scorer
+SHORTLIST_SIZE = int(os.getenv("VILLAGE_SHORTLIST_SIZE", 300))
+# Changes are patched onto the current state; after this many changed
+# villages, or a batch this big, the lookups are rebuilt from scratch
+COMPACT_AFTER = int(os.getenv("VILLAGE_INDEX_COMPACT_AFTER", 2000))
+
+VILLAGE_PROJECTION = {"villagename": 1, "stationId": 1, NEAREST_STATION_FIELD: 1, UPDATED_FIELD: 1}
+
+
+def make_entry(doc):
+    """
+    Reduce a village document to the fields matching needs, with the name
+    precomputed in both scripts so queries can arrive in either. Villages
+    without an assigned station fall back to their precomputed nearest one.
+    """
+    name = doc.get("villagename") or ""
+    latin = to_latin(name)
+    return {
+        "_id": doc["_id"],
+        "villagename": name,
+        "stationId": doc.get("stationId") or doc.get(NEAREST_STATION_FIELD),
+        "norm": latin.lower(),
+        "phonetic": phonetic_form(latin),
+        "devanagari": to_devanagari(name),
+    }
+
+
+# Everything derived from one version of the entries. It is replaced with a
+# single assignment, so readers on other threads never see a half-applied update.
+IndexState = namedtuple("IndexState", "entries positions grams phonetic devanagari")
+
+
+def build_state(entries, grams=None):
+    """Derive the lookups for a list of entries; grams may come from a snapshot"""
+    positions = {}
+    phonetic = {}
+    devanagari = {}
+    if grams is None:
+        grams = {}
+        for position, entry in enumerate(entries):
+            for gram in trigrams(entry["norm"]):
+                grams.setdefault(gram, []).append(position)
+    for position, entry in enumerate(entries):
+        positions[entry["_id"]] = position
+        phonetic.setdefault(strip_suffix(entry["phonetic"]), []).append(position)
+        devanagari.setdefault(entry["devanagari"], []).append(position)
+    return IndexState(entries, positions, grams, phonetic, devanagari)
+
+
+def live_entries(entries, positions):
+    """entries without the ones left behind by removals and re-inserts"""
+    return [entry for position, entry in enumerate(entries) if positions.get(entry["_id"]) == position]
+
+
+class OverlayPostings:
+    """
+    gram -> entry positions of a base mapping (a snapshot's, or a dict)
+    with changes on top: positions whose entry changed or went away are
+    dropped from the base, and the grams of their current entry added.
+    base_size is how many entries the base covers; later ones are appended.
+    Read-only; a change publishes a new overlay.
+    """
+
+    def __init__(self, base, base_size, added=None, dropped=frozenset()):
+        self.base = base
+        self.base_size = base_size
+        self.added = added or {}
+        self.dropped = dropped
+
+    def get(self, gram, default=None):
+        base = self.base.get(gram, ())
+        added = self.added.get(gram, [])
+        if not len(base) and not added:
+            return default
+        if self.dropped:
+            return [position for position in base if position not in self.dropped] + added
+        return list(base) + added
+
+
+def trigrams(text):
+    """Padded character trigrams, so short names and word edges still produce grams"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class VillageIndex:
+    """
+    Process-wide copy of the villages collection, loaded once and kept in sync
+    through a change stream, or a periodic delta poll when the deployment
+    does not support change streams. Updates build a new IndexState rather
+    than mutating the current one, so lookups may run on worker threads.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        # Bumped on every published change; process-pool workers compare it
+        self.version = 0
+        # Set while the index is exactly the snapshot it was loaded from
+        self.snapshot_path = None
+        self._state = build_state([])
+        self._last_seen = None
+        # Cluster time just before the load read the collection; the change
+        # stream starts there, so nothing written during or after the load is missed
+        self._watch_from = None
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def __len__(self):
+        return len(self._state.positions)
+
+    @property
+    def entries(self):
+        """Every village, in index order"""
+        state = self._state
+        if len(state.entries) == len(state.positions):
+            return state.entries
+        # Removed villages keep their place until the next compaction
+        return live_entries(state.entries, state.positions)
+
+    def get(self, village_id):
+        """Entry for a village _id, or None"""
+        state = self._state
+        position = state.positions.get(village_id)
+        return None if position is None else state.entries[position]
+
+    async def load(self, collection):
+        """Fetch every village once and build the index"""
+        await self._mark_watch_start(collection)
+        docs = await collection.find({}, VILLAGE_PROJECTION).to_list(length=None)
+        self._last_seen = None
+        self._publish(build_state([self._entry(doc) for doc in docs]))
+        self.loaded = True
+        logger.info(f"Village index loaded with {len(self)} villages")
+
+    def load_entries(self, entries):
+        """Build the index from entries already reduced by make_entry"""
+        self._publish(build_state(list(entries)))
+        self.loaded = True
+
+    def load_snapshot(self, path):
+        """Start from a memory-mapped snapshot instead of a full collection scan"""
+        entries, postings, last_seen = read_snapshot(path)
+        self._last_seen = last_seen
+        self._publish(build_state(entries, grams=postings))
+        self.snapshot_path = path
+        self.loaded = True
+        logger.info(f"Village index loaded with {len(self)} villages from {path}")
+
+    def save_snapshot(self, path):
+        """Write the current index as a snapshot other processes can map"""
+        state = self._state
+        if isinstance(state.grams, OverlayPostings):
+            state = build_state(self.entries)
+        write_snapshot(state.entries, state.grams, self._last_seen, path)
+
+    async def ensure_loaded(self, collection):
+        """
+        Load the index on first use; concurrent callers share one load. A
+        snapshot, when configured, is mapped and only the villages changed
+        since it was written are fetched.
+        """
+        if self.loaded:
+            return
+        async with self._lock:
+            if self.loaded:
+                return
+            if SNAPSHOT_PATH and os.path.exists(SNAPSHOT_PATH):
+                try:
+                    self.load_snapshot(SNAPSHOT_PATH)
+                    await self._mark_watch_start(collection)
+                    await self.refresh(collection)
+                    return
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Village snapshot unusable ({e}), loading from MongoDB")
+            await self.load(collection)
+
+    async def _mark_watch_start(self, collection):
+        # Only replica sets and sharded clusters report it, and only they have change streams
+        try:
+            reply = await collection.database.command("ping")
+            self._watch_from = reply.get("operationTime")
+        except PyMongoError as e:
+            logger.warning(f"Could not read the cluster time, watching from now: {e}")
+            self._watch_from = None
+
+    async def refresh(self, collection, reconcile=False):
+        """Pull only the villages changed since the last sync"""
+        query = {UPDATED_FIELD: {"$gt": self._last_seen}} if self._last_seen is not None else None
+        changed = []
+        if query is not None:
+            changed = await collection.find(query, VILLAGE_PROJECTION).to_list(length=None)
+
+        removed = []
+        if reconcile:
+            positions = self._state.positions
+            ids = {doc["_id"] for doc in await collection.find({}, {"_id": 1}).to_list(length=None)}
+            removed = [_id for _id in positions if _id not in ids]
+            missing = [_id for _id in ids if _id not in positions]
+            if missing:
+                changed += await collection.find({"_id": {"$in": missing}}, VILLAGE_PROJECTION).to_list(length=None)
+
+        if changed or removed:
+            self._apply(changed, removed)
+            logger.info(f"Village index refreshed: {len(changed)} changed, {len(removed)} removed")
+
+    def shortlist(self, query, limit=SHORTLIST_SIZE):
+        """
+        Villages sharing the most trigrams with the lowercased query, in index
+        order so ties resolve the same way as a full scan
+        """
+        state = self._state
+        counts = {}
+        for gram in trigrams(query):
+            for position in state.grams.get(gram, ()):
+                counts[position] = counts.get(position, 0) + 1
+        if len(counts) > limit:
+            counts = dict(heapq.nlargest(limit, counts.items(), key=itemgetter(1)))
+        return [state.entries[position] for position in sorted(counts)]
+
+    def phonetic_bucket(self, form):
+        """Villages whose phonetic stem matches that of an already folded name"""
+        state = self._state
+        return [state.entries[position] for position in state.phonetic.get(strip_suffix(form), ())]
+
+    def devanagari_matches(self, text):
+        """Villages whose Devanagari form is exactly the given text"""
+        state = self._state
+        return [state.entries[position] for position in state.devanagari.get(text.strip(), ())]
+
+    def start(self, collection):
+        """Start the background sync task if it is not already running"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._sync(collection))
+
+    async def stop(self):
+        """Cancel the background sync task"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _sync(self, collection):
+        try:
+            await self._watch(collection)
+        except OperationFailure as e:
+            # Standalone servers have no oplog to watch
+            logger.info(f"Change streams unavailable ({e}), polling villages every {REFRESH_INTERVAL}s")
+        except PyMongoError as e:
+            logger.warning(f"Village change stream failed: {e}, falling back to polling")
+        await self._poll(collection)
+
+    async def _watch(self, collection):
+        options = {"start_at_operation_time": self._watch_from} if self._watch_from is not None else {}
+        async with collection.watch(full_document="updateLookup", **options) as stream:
+            logger.info("Watching villages collection for changes")
+            while stream.alive:
+                # Whatever else has already arrived is applied together with it
+                batch = [await stream.next()]
+                while len(batch) < WATCH_BATCH:
+                    change = await stream.try_next()
+                    if change is None:
+                        break
+                    batch.append(change)
+                self._apply_changes(batch)
+
+    def _apply_changes(self, changes):
+        """Apply change stream events in one step; the last event for a village wins"""
+        docs = {}
+        removed = set()
+        for change in changes:
+            operation = change.get("operationType")
+            _id = change.get("documentKey", {}).get("_id")
+            if operation == "delete":
+                docs.pop(_id, None)
+                removed.add(_id)
+            elif operation in ("insert", "update", "replace") and change.get("fullDocument"):
+                removed.discard(_id)
+                docs[_id] = change["fullDocument"]
+        if docs or removed:
+            self._apply(list(docs.values()), removed)
+
+    async def _poll(self, collection):
+        polls = 0
+        while True:
+            await asyncio.sleep(REFRESH_INTERVAL)
+            polls += 1
+            try:
+                await self.refresh(collection, reconcile=polls % RECONCILE_EVERY == 0)
+            except PyMongoError as e:
+                logger.warning(f"Village index refresh failed: {e}")
+
+    def _entry(self, doc):
+        """make_entry(doc), noting how far the sync has seen"""
+        updated = doc.get(UPDATED_FIELD)
+        if updated is not None and (self._last_seen is None or updated > self._last_seen):
+            self._last_seen = updated
+        return make_entry(doc)
+
+    def _apply(self, docs=(), removed=()):
+        """
+        Publish a new state with docs upserted and removed ids dropped. Only
+        the changed villages' lookups are touched; the gram postings, from a
+        snapshot or not, are overlaid rather than rebuilt.
+        """
+        state = self._state
+        if len(docs) + len(removed) > COMPACT_AFTER:
+            self._rebuild(docs, removed)
+            return
+        overlay = isinstance(state.grams, OverlayPostings)
+        base = state.grams.base if overlay else state.grams
+        base_size = state.grams.base_size if overlay else len(state.entries)
+        dropped = set(state.grams.dropped) if overlay else set()
+        added = dict(state.grams.added) if overlay else {}
+        entries = list(state.entries)
+        positions = dict(state.positions)
+        phonetic = dict(state.phonetic)
+        devanagari = dict(state.devanagari)
+        # Lists shared with the published state are copied before their first change
+        copied = set()
+
+        def changed(lookup, key):
+            if (id(lookup), key) not in copied:
+                copied.add((id(lookup), key))
+                lookup[key] = list(lookup.get(key, ()))
+            return lookup[key]
+
+        def unlink(position):
+            entry = entries[position]
+            # Appended entries have no base postings to hide
+            if position < base_size:
+                dropped.add(position)
+            for gram in trigrams(entry["norm"]):
+                if position in added.get(gram, ()):
+                    changed(added, gram).remove(position)
+            for lookup, key in ((phonetic, strip_suffix(entry["phonetic"])), (devanagari, entry["devanagari"])):
+                if position in lookup.get(key, ()):
+                    changed(lookup, key).remove(position)
+                    if not lookup[key]:
+                        del lookup[key]
+
+        def link(position, entry):
+            entries[position] = entry
+            for gram in trigrams(entry["norm"]):
+                changed(added, gram).append(position)
+            changed(phonetic, strip_suffix(entry["phonetic"])).append(position)
+            changed(devanagari, entry["devanagari"]).append(position)
+
+        for _id in removed:
+            position = positions.pop(_id, None)
+            if position is not None:
+                unlink(position)
+
+        for doc in docs:
+            entry = self._entry(doc)
+            position = positions.get(entry["_id"])
+            if position is None:
+                position = positions[entry["_id"]] = len(entries)
+                entries.append(entry)
+            else:
+                unlink(position)
+            link(position, entry)
+
+        # Each base entry changed or removed, and each one appended, is counted once
+        if len(dropped) + len(entries) - base_size > COMPACT_AFTER:
+            self._publish(build_state(live_entries(entries, positions)))
+        else:
+            grams = OverlayPostings(base, base_size, {gram: ps for gram, ps in added.items() if ps},
+                                    frozenset(dropped))
+            self._publish(IndexState(entries, positions, grams, phonetic, devanagari))
+
+    def _rebuild(self, docs, removed):
+        """_apply for batches too big to patch in: derive every lookup again"""
+        removed = set(removed)
+        entries = {entry["_id"]: entry for entry in self.entries if entry["_id"] not in removed}
+        for doc in docs:
+            entry = self._entry(doc)
+            entries[entry["_id"]] = entry
+        self._publish(build_state(list(entries.values())))
+
+    def _publish(self, state):
+        self._state = state
+        self.snapshot_path = None
+        self.version += 1
+
+
+village_index = VillageIndex()
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from difflib import SequenceMatcher
+
+from .village_index import VillageIndex
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("VILLAGE_SCORER_WORKERS", 2))
+# inline scores on the event loop, thread uses a thread pool, process a pool
+# of worker processes that each map a snapshot of the index. SequenceMatcher
+# holds the GIL, so threads only keep the loop responsive; process scores
+# alongside it, at the cost of starting and feeding the workers
+SCORER = os.getenv("VILLAGE_SCORER", "thread")
+# Lookups allowed in flight at once; beyond that callers are turned away
+MAX_PENDING = int(os.getenv("VILLAGE_SCORER_MAX_PENDING", 8))
+TIMEOUT = float(os.getenv("VILLAGE_SCORER_TIMEOUT", 2.0))
+# Process workers are started from a clean server process, never forked from
+# this one: it runs Mongo driver threads and gRPC channels a fork would copy mid-use
+PROCESS_START_METHOD = os.getenv("VILLAGE_SCORER_START_METHOD", "forkserver")
+# Process workers hold a copy of the index, so they are only replaced with a
+# fresh copy this often however frequently villages change
+REBUILD_INTERVAL = int(os.getenv("VILLAGE_SCORER_REBUILD_SECS", 60))
+
+
+class ScoringUnavailable(Exception):
+    """The scorer is saturated or did not answer in time"""
+
+
+def could_reach(a, b, threshold):
+    """Cheap upper bounds on the similarity of two lowercased strings"""
+    total = len(a) + len(b)
+    if not total or 2.0 * min(len(a), len(b)) / total < threshold:
+        return False
+    return SequenceMatcher(None, a, b).quick_ratio() >= threshold
+
+
+def best_village(query, villages):
+    """Highest scoring village for a lowercased query; the first one wins ties"""
+    best_match = None
+    best_score = 0
+
+    for village in villages:
+        score = SequenceMatcher(None, query, village["norm"]).ratio()
+
+        if score > best_score:
+            best_score = score
+            best_match = village
+
+    return best_match, best_score
+
+
+def match_village(index, query, threshold, verify=True):
+    """
+    Best village for a lowercased query: the trigram shortlist, then unless
+    verify is off, every village whose upper bound can still reach the
+    threshold or beat the shortlist's best, so a match at or above the
+    threshold scores the same as the best of a full scan
+    """
+    best_match, best_score = best_village(query, index.shortlist(query))
+
+    if verify and best_score < 1.0:
+        bound = max(best_score, threshold)
+        reachable = [
+            village for village in index.entries
+            if could_reach(query, village["norm"], bound)
+        ]
+        village, score = best_village(query, reachable)
+        if score > best_score:
+            best_match, best_score = village, score
+
+    return best_match, best_score
+
+
+# The index copy held by each process pool worker
+worker_index = None
+
+
+def _init_worker(snapshot_path):
+    global worker_index
+    worker_index = VillageIndex()
+    worker_index.load_snapshot(snapshot_path)
+
+
+def _worker_size():
+    return len(worker_index)
+
+
+def _match_in_worker(query, threshold):
+    """Runs in a worker process; returns the _id so the entry is not pickled back"""
+    village, score = match_village(worker_index, query, threshold)
+    return (village["_id"] if village else None), score
+
+
+class ScoringPool:
+    """
+    Runs village scoring in an executor so a long fuzzy scan never stalls the
+    event loop that serves the call audio. Work is bounded: at most
+    max_pending lookups are in flight and each caller waits at most timeout
+    seconds, after which ScoringUnavailable is raised.
+    """
+
+    def __init__(self, index, mode=SCORER, workers=WORKERS, max_pending=MAX_PENDING, timeout=TIMEOUT):
+        self.index = index
+        self.mode = mode
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._executor = None
+        self._version = None
+        self._built_at = 0
+        self._snapshot = None
+        self._lock = asyncio.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="village-scorer")
+        return self._executor
+
+    async def _get_process_executor(self):
+        async with self._lock:
+            stale = self._version != self.index.version
+            if self._executor is None or (stale and time.monotonic() - self._built_at >= REBUILD_INTERVAL):
+                version = self.index.version
+                # Workers map the index from a snapshot rather than receive a copy
+                path = self.index.snapshot_path or await asyncio.to_thread(self._write_snapshot)
+                if self._executor is not None:
+                    # Lookups already running finish on the old workers
+                    self._executor.shutdown(wait=False)
+                self._executor = ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context(PROCESS_START_METHOD),
+                    initializer=_init_worker,
+                    initargs=(path,),
+                )
+                self._version = version
+                self._built_at = time.monotonic()
+                logger.info(f"Started {self.workers} village scoring processes")
+            return self._executor
+
+    def _write_snapshot(self):
+        """Snapshot the index for the next workers; the previous one is no longer needed"""
+        fd, path = tempfile.mkstemp(prefix="village-scorer-", suffix=".snapshot")
+        os.close(fd)
+        self.index.save_snapshot(path)
+        self._remove_snapshot()
+        self._snapshot = path
+        return path
+
+    def _remove_snapshot(self):
+        # Workers still running keep their mapping of a removed file
+        if self._snapshot is not None:
+            try:
+                os.remove(self._snapshot)
+            except OSError:
+                pass
+            self._snapshot = None
+
+    async def start(self):
+        """Start the worker processes and load their index copies before the first lookup needs them"""
+        if self.mode != "process":
+            return
+        loop = asyncio.get_running_loop()
+        executor = await self._get_process_executor()
+        sizes = await asyncio.gather(*(loop.run_in_executor(executor, _worker_size) for _ in range(self.workers)))
+        logger.info(f"Village scoring processes ready with {max(sizes)} villages each")
+
+    async def match(self, query, threshold):
+        """(village, score) for a lowercased query, scored off the event loop"""
+        if self.mode == "inline":
+            return match_village(self.index, query, threshold)
+
+        # Replacing the workers may wait on a snapshot; the bound is checked after it
+        executor = await self._get_process_executor() if self.mode == "process" else self._get_executor()
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise ScoringUnavailable(f"{self.pending} village lookups already pending")
+
+        loop = asyncio.get_running_loop()
+        if self.mode == "process":
+            future = loop.run_in_executor(executor, _match_in_worker, query, threshold)
+        else:
+            future = loop.run_in_executor(executor, match_village, self.index, query, threshold)
+
+        # The slot is held until the work itself ends, not when the caller
+        # gives up, so abandoned lookups still count against the bound
+        self.pending += 1
+        future.add_done_callback(self._release)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise ScoringUnavailable(f"village lookup took longer than {self.timeout}s")
+
+        if self.mode == "process":
+            village_id, score = result
+            return self.index.get(village_id), score
+        return result
+
+    def _release(self, future):
+        self.pending -= 1
+
+    def stats(self):
+        return {"mode": self.mode, "pending": self.pending, "rejected": self.rejected, "timeouts": self.timeouts}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._remove_snapshot()
@@ -0,0 +1,200 @@
+import argparse
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+import bson
+import bson.errors
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+# Binary layout, all integers in host byte order:
+#   header   magic, version, entry count, gram count, then byte offsets of
+#            the sections below
+#   meta     BSON document with sync state (last_seen updated value)
+#   offsets  uint32[S + 1] into the blob, S = entries * len(FIELDS) + grams
+#   blob     UTF-8 strings: every entry field, then the sorted grams
+#   starts   uint32[grams + 1] into postings, per gram
+#   postings uint32 entry positions, ascending within each gram
+# Sections are 4-byte aligned so they can be cast to uint32 views in place.
+
+MAGIC = b"VLGSNAP1"
+VERSION = 1
+FIELDS = ("_id", "villagename", "stationId", "norm", "phonetic", "devanagari")
+HEADER = struct.Struct("=8sIII6Q")
+
+SNAPSHOT_PATH = os.getenv("VILLAGE_SNAPSHOT_PATH", "")
+REFRESH_INTERVAL = int(os.getenv("VILLAGE_SNAPSHOT_REFRESH_SECS", 300))
+
+
+def _encode_id(value):
+    if isinstance(value, ObjectId):
+        return "o:" + str(value)
+    if value is None:
+        return "n:"
+    return "s:" + str(value)
+
+
+def _decode_id(text):
+    kind, value = text[:2], text[2:]
+    if kind == "o:":
+        return ObjectId(value)
+    if kind == "n:":
+        return None
+    return value
+
+
+def _pad(buffer):
+    buffer.extend(b"\0" * (-len(buffer) % 4))
+
+
+def write_snapshot(entries, postings, last_seen, path):
+    """
+    Write the index to path atomically, so workers that still map the old
+    file keep a consistent view until they reload
+    """
+    strings = []
+    for entry in entries:
+        for field in FIELDS:
+            value = entry.get(field)
+            strings.append(_encode_id(value) if field in ("_id", "stationId") else value or "")
+    grams = sorted(postings)
+    strings.extend(grams)
+
+    blob = bytearray()
+    offsets = array("I", [0])
+    for text in strings:
+        blob += text.encode("utf-8")
+        offsets.append(len(blob))
+
+    starts = array("I", [0])
+    positions = array("I")
+    for gram in grams:
+        positions.extend(postings[gram])
+        starts.append(len(positions))
+
+    body = bytearray(b"\0" * HEADER.size)
+    sections = []
+    for part in (bson.encode({"last_seen": last_seen}), offsets.tobytes(), bytes(blob),
+                 starts.tobytes(), positions.tobytes()):
+        sections.append(len(body))
+        body += part
+        _pad(body)
+    sections.append(len(body))
+    body[:HEADER.size] = HEADER.pack(MAGIC, VERSION, len(entries), len(grams), *sections)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+    logger.info(f"Wrote village snapshot with {len(entries)} villages to {path}")
+
+
+class SnapshotPostings:
+    """Read-only gram -> entry positions mapping served from the mapped file"""
+
+    def __init__(self, grams, starts, positions):
+        self._grams = grams
+        self._starts = starts
+        self._positions = positions
+
+    def __len__(self):
+        return len(self._grams)
+
+    def __iter__(self):
+        return iter(self._grams)
+
+    def __getitem__(self, gram):
+        i = self._grams[gram]
+        return self._positions[self._starts[i]:self._starts[i + 1]]
+
+    def get(self, gram, default=None):
+        if gram not in self._grams:
+            return default
+        return self[gram]
+
+
+def read_snapshot(path):
+    """
+    Map a snapshot file and return (entries, postings, last_seen). The
+    postings stay in the shared page cache instead of per-process lists.
+    A truncated or otherwise damaged file raises ValueError.
+    """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return _read_mapped(mapped)
+    except (struct.error, bson.errors.BSONError, TypeError, IndexError, ValueError) as e:
+        raise ValueError(f"{path} is not a readable village snapshot: {e}") from e
+
+
+def _read_mapped(mapped):
+    view = memoryview(mapped)
+
+    magic, version, entry_count, gram_count, *sections = HEADER.unpack_from(view)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"not a version {VERSION} village snapshot")
+    meta_at, offsets_at, blob_at, starts_at, postings_at, end_at = sections
+    # The writer ends the file with the last section, so anything else was cut short or appended to
+    if end_at != len(mapped):
+        raise ValueError(f"{len(mapped)} bytes where the header promises {end_at}")
+    if not HEADER.size <= meta_at <= offsets_at <= blob_at <= starts_at <= postings_at <= end_at:
+        raise ValueError("sections out of order")
+    string_count = entry_count * len(FIELDS) + gram_count
+    if offsets_at + 4 * (string_count + 1) > blob_at or starts_at + 4 * (gram_count + 1) > postings_at:
+        raise ValueError("section sizes do not match the entry and gram counts")
+
+    last_seen = bson.decode(view[meta_at:offsets_at].tobytes()).get("last_seen")
+    offsets = view[offsets_at:offsets_at + 4 * (string_count + 1)].cast("I")
+    blob = view[blob_at:starts_at]
+    if offsets[string_count] > len(blob):
+        raise ValueError("strings run past their section")
+
+    def string(i):
+        return str(blob[offsets[i]:offsets[i + 1]], "utf-8")
+
+    entries = []
+    for position in range(entry_count):
+        base = position * len(FIELDS)
+        entry = {field: string(base + f) for f, field in enumerate(FIELDS)}
+        entry["_id"] = _decode_id(entry["_id"])
+        entry["stationId"] = _decode_id(entry["stationId"])
+        entries.append(entry)
+
+    base = entry_count * len(FIELDS)
+    grams = {string(base + i): i for i in range(gram_count)}
+    starts = view[starts_at:starts_at + 4 * (gram_count + 1)].cast("I")
+    positions = view[postings_at:end_at].cast("I")
+    if starts[gram_count] > len(positions) or max(positions, default=0) >= max(entry_count, 1):
+        raise ValueError("postings point past the entries")
+    return entries, SnapshotPostings(grams, starts, positions), last_seen
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Build or refresh the village search snapshot")
+    parser.add_argument("--path", default=SNAPSHOT_PATH, help="snapshot file (default: $VILLAGE_SNAPSHOT_PATH)")
+    parser.add_argument("--every", type=int, default=0, metavar="SECS",
+                        help=f"keep running and refresh every SECS seconds (e.g. {REFRESH_INTERVAL})")
+    args = parser.parse_args()
+    if not args.path:
+        sys.exit("No snapshot path: pass --path or set VILLAGE_SNAPSHOT_PATH")
+
+    from .location import db
+    from .village_index import VillageIndex
+
+    index = VillageIndex()
+    await index.load(db["villages"])
+    index.save_snapshot(args.path)
+    while args.every:
+        await asyncio.sleep(args.every)
+        await index.refresh(db["villages"], reconcile=True)
+        index.save_snapshot(args.path)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+
+from pymongo import UpdateOne
+
+from .station_index import STATION_PROJECTION, STATIONS_WITH_COORDINATES, StationIndex, station_point
+
+logger = logging.getLogger(__name__)
+
+# Denormalized fields written on each village
+NEAREST_STATION_FIELD = "nearestStationId"
+NEAREST_DISTANCE_FIELD = "nearestStationDistance"
+NEAREST_STATIONS_FIELD = "nearestStations"
+# Fingerprint of the stations and the village point the fields were computed from
+NEAREST_VERSION_FIELD = "nearestStationsVersion"
+NEAREST_FROM_FIELD = "nearestStationsFrom"
+
+NEAREST_COUNT = int(os.getenv("VILLAGE_NEAREST_STATIONS", 3))
+
+
+def stations_version(stations):
+    """Changes whenever a station is added, removed or moved"""
+    digest = hashlib.sha1()
+    for station in sorted(stations, key=lambda station: str(station["_id"])):
+        digest.update(f"{station['_id']}:{station_point(station)};".encode())
+    return digest.hexdigest()
+
+
+def nearest_fields(index, village, version, count=NEAREST_COUNT):
+    """The denormalized nearest-station fields for one village, or None without coordinates"""
+    point = station_point(village)
+    if point is None:
+        return None
+    nearest = index.nearest(point[0], point[1], count)
+    if not nearest:
+        return None
+    return {
+        NEAREST_STATION_FIELD: str(nearest[0][1]["_id"]),
+        NEAREST_DISTANCE_FIELD: nearest[0][0],
+        NEAREST_STATIONS_FIELD: [
+            {"stationId": str(station["_id"]), "distance": distance} for distance, station in nearest
+        ],
+        NEAREST_VERSION_FIELD: version,
+        NEAREST_FROM_FIELD: village["location"]["coordinates"],
+    }
+
+
+async def ensure_nearest_indexes(db):
+    """Villages by nearest station, and the version the incremental run filters on"""
+    await db["villages"].create_index(NEAREST_STATION_FIELD)
+    await db["villages"].create_index(NEAREST_VERSION_FIELD)
+
+
+async def assign_nearest_stations(db, recompute=False, batch_size=500):
+    """
+    Write each village's nearest stations and distances. By default only
+    villages computed against a different set of stations, or whose own
+    coordinates moved since, are rewritten.
+    """
+    stations = await db["piusers"].find(STATIONS_WITH_COORDINATES, STATION_PROJECTION).to_list(length=None)
+    index = StationIndex()
+    index.build(stations)
+    if not len(index):
+        logger.warning("No police stations with coordinates, nothing to assign")
+        return 0
+    version = stations_version(stations)
+
+    villages = db["villages"]
+    query = {"location.coordinates.1": {"$exists": True}}
+    if not recompute:
+        query["$or"] = [
+            {NEAREST_VERSION_FIELD: {"$ne": version}},
+            {"$expr": {"$ne": [f"${NEAREST_FROM_FIELD}", "$location.coordinates"]}},
+        ]
+
+    updated = 0
+    batch = []
+    async for village in villages.find(query, {"location": 1}):
+        fields = nearest_fields(index, village, version)
+        if fields is None:
+            continue
+        batch.append(UpdateOne({"_id": village["_id"]}, {"$set": fields}))
+        if len(batch) >= batch_size:
+            updated += (await villages.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await villages.bulk_write(batch, ordered=False)).modified_count
+
+    logger.info(f"Assigned nearest stations to {updated} villages against {len(index)} stations")
+    return updated
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Precompute each village's nearest police stations")
+    parser.add_argument("--all", action="store_true", help="recompute every village, not only stale ones")
+    args = parser.parse_args()
+
+    from .location import db
+
+    await ensure_nearest_indexes(db)
+    print(await assign_nearest_stations(db, recompute=args.all))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,234 @@
+import asyncio
+import json
+import os
+import time
+from collections import namedtuple
+from functools import lru_cache
+
+from google.cloud import speech_v2, texttospeech_v1
+from google.oauth2 import service_account
+from openai import AsyncOpenAI
+from piopiy.audio.vad.silero import SileroVADAnalyzer
+from piopiy.pipeline.service_switcher import ServiceSwitcher, ServiceSwitcherStrategyManual
+from piopiy.services.google.stt import GoogleSTTService
+from piopiy.services.google.tts import GoogleTTSService
+from piopiy.services.openai.llm import OpenAILLMService
+from piopiy.services.stt_service import STTService
+from piopiy.transcriptions.language import Language
+
+# Languages a call can switch between, in ServiceSwitcher order; the first is active
+LANGUAGES = {"marathi": Language.MR_IN, "hindi": Language.HI_IN, "english": Language.EN_US}
+TTS_VOICE = "en-US-Chirp3-HD-Algenib"
+SAMPLE_RATE = 16000
+# Service sets kept built and ready for the next calls
+PREWARM = int(os.getenv("VOICE_SERVICE_PREWARM", 4))
+
+
+@lru_cache(maxsize=1)
+def google_credentials() -> str:
+    """The service account JSON named by GOOGLE_API_KEY, read from disk once"""
+    with open(os.getenv("GOOGLE_API_KEY")) as f:
+        return json.dumps(json.load(f))
+
+
+@lru_cache(maxsize=1)
+def google_service_account():
+    return service_account.Credentials.from_service_account_info(json.loads(google_credentials()))
+
+
+# One gRPC channel per API for the whole process; requests and streams from
+# every call are multiplexed over it
+@lru_cache(maxsize=1)
+def speech_client():
+    return speech_v2.SpeechAsyncClient(credentials=google_service_account())
+
+
+@lru_cache(maxsize=1)
+def tts_client():
+    return texttospeech_v1.TextToSpeechAsyncClient(credentials=google_service_account())
+
+
+@lru_cache(maxsize=1)
+def openai_client():
+    return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+
+class SharedGoogleSTTService(GoogleSTTService):
+    """
+    GoogleSTTService streaming over the process-wide Speech client.
+    GoogleSTTService.__init__ has no hook for its client: it parses the
+    credentials and opens a SpeechAsyncClient of its own. So its setup is
+    repeated here, as of piopiy 0.6, around the shared client instead.
+    """
+
+    def __init__(self, *, sample_rate=None, params=None, **kwargs):
+        STTService.__init__(self, sample_rate=sample_rate, **kwargs)
+
+        params = params or GoogleSTTService.InputParams()
+
+        self._location = "global"
+        self._stream = None
+        self._config = None
+        self._streaming_task = None
+
+        self._stream_start_time = 0
+        self._last_audio_input = []
+        self._audio_input = []
+        self._result_end_time = 0
+        self._is_final_end_time = 0
+        self._final_request_end_time = 0
+        self._bridging_offset = 0
+        self._last_transcript_was_final = False
+        self._new_stream = True
+        self._restart_counter = 0
+
+        self._project_id = json.loads(google_credentials()).get("project_id")
+        if not self._project_id:
+            raise ValueError("Project ID not found in credentials")
+        self._client = speech_client()
+
+        self._settings = {
+            "language_codes": [
+                self.language_to_service_language(lang) for lang in params.language_list
+            ],
+            "model": params.model,
+            "use_separate_recognition_per_channel": params.use_separate_recognition_per_channel,
+            "enable_automatic_punctuation": params.enable_automatic_punctuation,
+            "enable_spoken_punctuation": params.enable_spoken_punctuation,
+            "enable_spoken_emojis": params.enable_spoken_emojis,
+            "profanity_filter": params.profanity_filter,
+            "enable_word_time_offsets": params.enable_word_time_offsets,
+            "enable_word_confidence": params.enable_word_confidence,
+            "enable_interim_results": params.enable_interim_results,
+            "enable_voice_activity_events": params.enable_voice_activity_events,
+        }
+
+
+class SharedGoogleTTSService(GoogleTTSService):
+    """GoogleTTSService synthesizing over the process-wide Text-to-Speech client"""
+
+    def _create_client(self, credentials, credentials_path):
+        return tts_client()
+
+
+class SharedOpenAILLMService(OpenAILLMService):
+    """OpenAILLMService on the process-wide AsyncOpenAI client and its connection pool"""
+
+    def create_client(self, **kwargs):
+        return openai_client()
+
+
+def stt_params(language):
+    return GoogleSTTService.InputParams(
+        languages=[language],
+        enable_automatic_punctuation=False,
+        enable_spoken_punctuation=False,
+        enable_spoken_emojis=False,
+        enable_word_time_offsets=True,
+        enable_word_confidence=True,
+        enable_interim_results=True,
+        enable_voice_activity_events=True,
+        model="latest_long",
+    )
+
+
+# Everything one call's pipeline needs, built ahead of the call
+VoiceServices = namedtuple("VoiceServices", "stt tts stt_services tts_services llm vad")
+
+
+def build_vad():
+    return SileroVADAnalyzer(sample_rate=SAMPLE_RATE)
+
+
+def build_voice_services(vad=None) -> VoiceServices:
+    stt = {
+        name: SharedGoogleSTTService(params=stt_params(language), sample_rate=SAMPLE_RATE)
+        for name, language in LANGUAGES.items()
+    }
+    tts = {
+        name: SharedGoogleTTSService(voice_id=TTS_VOICE, params=GoogleTTSService.InputParams(languages=[language]))
+        for name, language in LANGUAGES.items()
+    }
+    return VoiceServices(
+        stt=stt,
+        tts=tts,
+        stt_services=ServiceSwitcher(services=list(stt.values()), strategy_type=ServiceSwitcherStrategyManual),
+        tts_services=ServiceSwitcher(services=list(tts.values()), strategy_type=ServiceSwitcherStrategyManual),
+        llm=SharedOpenAILLMService(stream=True, system_language_awareness=True),
+        vad=vad or build_vad(),
+    )
+
+
+class VoiceServiceBuffer:
+    """
+    Voice service sets built ahead of incoming calls. A call takes a set
+    and releases it when it ends. Pipeline processors keep per-call state,
+    so a released set is discarded, not handed to the next caller; what
+    calls share are the clients, channels and credentials underneath.
+    The buffer is topped back up in the background after every take.
+    """
+
+    def __init__(self, size=PREWARM):
+        self.size = size
+        self._ready = []
+        self._filling = None
+        self.in_use = 0
+        self.prebuilt = 0
+        self.on_demand = 0
+        self.build_secs = 0.0
+        self.builds = 0
+
+    async def _build(self):
+        started = time.perf_counter()
+        # The gRPC channels belong to the event loop, so they are opened here
+        # once; then the whole set, the Silero ONNX model above all, is built
+        # off the loop, which keeps serving calls while the buffer refills
+        speech_client(), tts_client()
+        services = await asyncio.to_thread(build_voice_services)
+        self.build_secs += time.perf_counter() - started
+        self.builds += 1
+        return services
+
+    async def _fill(self):
+        while len(self._ready) < self.size:
+            try:
+                self._ready.append(await self._build())
+            except Exception as e:
+                print(f"Voice service buffer refill failed: {e}")
+                return
+
+    def _refill(self):
+        if self._filling is None or self._filling.done():
+            self._filling = asyncio.ensure_future(self._fill())
+
+    async def start(self):
+        """Build the first sets, so the first calls find them ready"""
+        self._refill()
+        await self._filling
+
+    async def take(self) -> VoiceServices:
+        if self._ready:
+            self.prebuilt += 1
+            services = self._ready.pop()
+        else:
+            self.on_demand += 1
+            services = await self._build()
+        self.in_use += 1
+        self._refill()
+        return services
+
+    def release(self, services: VoiceServices):
+        """The call using services has ended; the set is dropped"""
+        self.in_use -= 1
+
+    def stats(self):
+        return {
+            "ready": len(self._ready),
+            "in_use": self.in_use,
+            "prebuilt_takes": self.prebuilt,
+            "on_demand_builds": self.on_demand,
+            "mean_build_ms": round(self.build_secs / self.builds * 1000, 1) if self.builds else None,
+        }
+
+
+voice_service_buffer = VoiceServiceBuffer()